@@ -0,0 +1,130 @@
+"""
+OCR benchmarks: full 5x3 grid vs adaptive early-exit, or (--engines)
+pytesseract subprocesses vs the in-process tesserocr engine.
+
+    python bench_ocr.py                     # built-in synthetic samples
+    python bench_ocr.py photo1.jpg ...      # your own images (grid output = reference)
+    python bench_ocr.py --engines [imgs]    # same grid, per OCR backend
+
+Needs tesseract installed (and tesserocr for --engines). Accuracy is
+word-level similarity to the ground truth (synthetic samples) or to the
+grid result (your images).
+"""
+import os
+import sys
+import time
+import difflib
+from io import BytesIO
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")  # main.py refuses to import without these
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageOps
+
+import main
+
+SAMPLE_TEXT = (
+    "Photosynthesis converts light energy into chemical energy.\n"
+    "Chlorophyll absorbs mostly blue and red light.\n"
+    "The Calvin cycle fixes carbon dioxide into glucose."
+)
+
+def _render(text, noise=False, low_contrast=False, invert=False):
+    img = Image.new("L", (900, 200), 235 if low_contrast else 255)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=26)
+    draw.multiline_text((20, 20), text, fill=150 if low_contrast else 0, font=font, spacing=14)
+    if noise:
+        img = img.rotate(1.5, fillcolor=255).filter(ImageFilter.GaussianBlur(1.2))
+    if invert:
+        img = ImageOps.invert(img)
+    buf = BytesIO()
+    img.convert("RGB").save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+def _samples():
+    return [
+        ("clean", _render(SAMPLE_TEXT), SAMPLE_TEXT),
+        ("blurred", _render(SAMPLE_TEXT, noise=True), SAMPLE_TEXT),
+        ("low-contrast", _render(SAMPLE_TEXT, low_contrast=True), SAMPLE_TEXT),
+        ("inverted", _render(SAMPLE_TEXT, invert=True), SAMPLE_TEXT),
+    ]
+
+def _similarity(a, b):
+    return difflib.SequenceMatcher(None, a.lower().split(), b.lower().split()).ratio()
+
+def _timed(raw, strategy):
+    calls = {"n": 0}
+    orig_str, orig_data = main.pytesseract.image_to_string, main.pytesseract.image_to_data
+
+    def count(fn):
+        def wrapper(*a, **k):
+            calls["n"] += 1
+            return fn(*a, **k)
+        return wrapper
+
+    main.pytesseract.image_to_string, main.pytesseract.image_to_data = count(orig_str), count(orig_data)
+    try:
+        t0 = time.perf_counter()
+        text = main._ocr_image_bytes(raw, strategy=strategy)
+        return text, time.perf_counter() - t0, calls["n"]
+    finally:
+        main.pytesseract.image_to_string, main.pytesseract.image_to_data = orig_str, orig_data
+
+def _cases(paths):
+    if paths:
+        return [(os.path.basename(p), open(p, "rb").read(), None) for p in paths]
+    return _samples()
+
+def engines_cli(paths):
+    main._setup_tesseract_cmd()
+    cases = _cases(paths)
+    engines = [main._PytesseractEngine()]
+    if main.tesserocr is not None:
+        engines.append(main._TesserocrEngine())
+    else:
+        print("tesserocr not installed: only pytesseract is measured")
+
+    saved_engine = main._ocr_engine
+    try:
+        print(f"{'image':<16}" + "".join(f"{e.name + ' s':>16}" for e in engines))
+        totals = [0.0] * len(engines)
+        for name, raw, _ in cases:
+            row = f"{name[:15]:<16}"
+            for k, engine in enumerate(engines):
+                main._ocr_engine = engine
+                main._ocr_image_bytes(raw, strategy="grid")  # warm-up: first tesserocr call loads the model
+                t0 = time.perf_counter()
+                main._ocr_image_bytes(raw, strategy="grid")
+                sec = time.perf_counter() - t0
+                totals[k] += sec
+                row += f"{sec:>16.2f}"
+            print(row)
+        print(f"{'total':<16}" + "".join(f"{t:>16.2f}" for t in totals))
+    finally:
+        main._ocr_engine = saved_engine
+
+def main_cli(paths):
+    main._setup_tesseract_cmd()
+    cases = _cases(paths)
+
+    print(f"{'image':<16}{'grid s':>8}{'runs':>6}{'adapt s':>9}{'runs':>6}{'saved':>8}{'acc grid':>10}{'acc adapt':>11}")
+    tot_grid = tot_adapt = 0.0
+    for name, raw, truth in cases:
+        g_txt, g_sec, g_runs = _timed(raw, "grid")
+        a_txt, a_sec, a_runs = _timed(raw, "adaptive")
+        ref = truth if truth is not None else g_txt
+        tot_grid += g_sec
+        tot_adapt += a_sec
+        saved = (1 - a_sec / g_sec) * 100 if g_sec else 0.0
+        print(f"{name[:15]:<16}{g_sec:>8.2f}{g_runs:>6}{a_sec:>9.2f}{a_runs:>6}{saved:>7.0f}%"
+              f"{_similarity(g_txt, ref):>10.2f}{_similarity(a_txt, ref):>11.2f}")
+    if tot_grid:
+        print(f"total: grid {tot_grid:.2f}s, adaptive {tot_adapt:.2f}s ({(1 - tot_adapt / tot_grid) * 100:.0f}% saved)")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--engines"]:
+        engines_cli(args[1:])
+    else:
+        main_cli(args)
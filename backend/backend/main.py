@@ -1,21 +1,40 @@
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, HTTPException, Request, Depends, Query, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, conint, constr
-from typing import List, Optional, Dict, Any
-from collections import Counter
+from typing import List, Optional, Dict, Any, Tuple
+from collections import OrderedDict
 from datetime import datetime
 from dotenv import load_dotenv
 
 import os
 import re
+import math
 import json
+import time
+import asyncio
+import base64
+import hashlib
+import secrets
+import copy
+import difflib
+import csv
+import sqlite3
+import tempfile
+import threading
+import weakref
 import httpx
-import requests
+import jwt
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import pytesseract
-from pdf2image import convert_from_bytes
-from io import BytesIO
+try:  # optional: keeps the tesseract API loaded in-process (see _OcrEngine)
+    import tesserocr
+except ImportError:
+    tesserocr = None
+from pdf2image import convert_from_path
+from io import BytesIO, StringIO
 import pdfplumber
 from PIL import Image, ImageOps, ImageEnhance
 
@@ -32,11 +51,141 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 AI_API_URL   = os.getenv("AI_API_URL")
 AI_API_KEY   = os.getenv("AI_API_KEY")
 
+# Local JWT verification (see get_current_user). HS256 projects set the secret;
+# asymmetric projects are verified against the auth JWKS endpoint instead.
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUD    = os.getenv("SUPABASE_JWT_AUD", "authenticated")
+AUTH_CACHE_TTL_SEC  = int(os.getenv("AUTH_CACHE_TTL_SEC", "60"))
+AUTH_CACHE_MAX      = int(os.getenv("AUTH_CACHE_MAX", "2048"))
+AUTH_REMOTE_ON_MISS = os.getenv("AUTH_REMOTE_ON_MISS", "0") == "1"  # also ask /auth/v1/user on cache miss (revocation)
+
+# Outbound HTTP pools (one per upstream, see _http())
+HTTP_MAX_CONNECTIONS    = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE      = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY   = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED           = os.getenv("HTTP2_ENABLED", "1") == "1"
+AI_GENERATE_TIMEOUT_SEC = float(os.getenv("AI_GENERATE_TIMEOUT_SEC", "120"))
+AI_EVALUATE_TIMEOUT_SEC = float(os.getenv("AI_EVALUATE_TIMEOUT_SEC", "30"))
+AUTH_TIMEOUT_SEC        = float(os.getenv("AUTH_TIMEOUT_SEC", "10"))
+DB_POOL_SIZE            = int(os.getenv("DB_POOL_SIZE", "16"))
+AI_GRADING_CONCURRENCY  = int(os.getenv("AI_GRADING_CONCURRENCY", "16"))  # process-wide, across submissions
+AI_GRADE_TIMEOUT_SEC    = float(os.getenv("AI_GRADE_TIMEOUT_SEC", "45"))
+GRADE_CACHE_MAX         = int(os.getenv("GRADE_CACHE_MAX", "20000"))
+GRADE_CACHE_TTL_SEC     = int(os.getenv("GRADE_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+GRADE_CACHE_DB          = os.getenv("GRADE_CACHE_DB")  # optional sqlite file = persistent tier
+AI_BATCH_GRADING        = os.getenv("AI_BATCH_GRADING", "1") == "1"
+AI_BATCH_MAX_ITEMS      = int(os.getenv("AI_BATCH_MAX_ITEMS", "25"))
+AI_BATCH_TIMEOUT_SEC    = float(os.getenv("AI_BATCH_TIMEOUT_SEC", "90"))
+PREGRADE_TOKEN_THRESHOLD = float(os.getenv("PREGRADE_TOKEN_THRESHOLD", "0.9"))
+AI_GENERATE_CONCURRENCY = int(os.getenv("AI_GENERATE_CONCURRENCY", "6"))  # chunk calls in flight per request
+GENERATE_OVER_ASK       = float(os.getenv("GENERATE_OVER_ASK", "0.25"))  # extra share asked of each chunk
+OCR_WORKERS             = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+OCR_ATTEMPT_TIMEOUT_SEC = float(os.getenv("OCR_ATTEMPT_TIMEOUT_SEC", "30"))
+OCR_STRATEGY            = os.getenv("OCR_STRATEGY", "adaptive")  # "adaptive" | "grid"
+OCR_ENGINE              = os.getenv("OCR_ENGINE", "auto")  # "auto" | "tesserocr" | "pytesseract"
+OCR_CONFIDENCE_TARGET   = float(os.getenv("OCR_CONFIDENCE_TARGET", "80"))  # mean word conf that ends the search
+OCR_MIN_WORDS           = int(os.getenv("OCR_MIN_WORDS", "3"))
+OCR_TARGET_DPI          = float(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_ASSUMED_DPI         = float(os.getenv("OCR_ASSUMED_DPI", "96"))  # when the image carries no dpi info
+OCR_MAX_PIXELS          = int(os.getenv("OCR_MAX_PIXELS", str(12_000_000)))  # per working image
+OCR_VARIANTS_IN_FLIGHT  = int(os.getenv("OCR_VARIANTS_IN_FLIGHT", "2"))  # variant images alive at once
+PDF_OCR_DPI             = int(os.getenv("PDF_OCR_DPI", "300"))
+PDF_OCR_MAX_PAGES       = int(os.getenv("PDF_OCR_MAX_PAGES", "50"))
+PDF_OCR_PAGE_CONCURRENCY = int(os.getenv("PDF_OCR_PAGE_CONCURRENCY", "2"))  # = page rasters in memory at once
+PDF_MIN_PAGE_CHARS      = int(os.getenv("PDF_MIN_PAGE_CHARS", "20"))  # alnum chars for a usable text layer
+EXTRACT_CACHE_MAX       = int(os.getenv("EXTRACT_CACHE_MAX", "128"))
+EXTRACT_CACHE_TTL_SEC   = int(os.getenv("EXTRACT_CACHE_TTL_SEC", str(24 * 3600)))
+EXTRACT_CACHE_DIR       = os.getenv("EXTRACT_CACHE_DIR")  # optional on-disk tier
+PREVIEW_TTL_SEC         = int(os.getenv("PREVIEW_TTL_SEC", "3600"))
+PREVIEW_STORE_MAX       = int(os.getenv("PREVIEW_STORE_MAX", "1000"))
+GEN_CACHE_MAX           = int(os.getenv("GEN_CACHE_MAX", "500"))
+GEN_CACHE_TTL_SEC       = int(os.getenv("GEN_CACHE_TTL_SEC", str(7 * 24 * 3600)))  # freshness window
+QUIZ_CACHE_MAX          = int(os.getenv("QUIZ_CACHE_MAX", "256"))
+QUIZ_CACHE_TTL_SEC      = int(os.getenv("QUIZ_CACHE_TTL_SEC", "300"))  # bounds staleness from edits made outside the API
+QUIZ_TOTALS_COLUMNS     = os.getenv("QUIZ_TOTALS_COLUMNS", "0") == "1"  # quizzes has total_marks int + marks_breakdown jsonb
+QUIZ_TOTALS_CACHE_MAX   = int(os.getenv("QUIZ_TOTALS_CACHE_MAX", "2000"))
+QUIZ_TOTALS_TTL_SEC     = int(os.getenv("QUIZ_TOTALS_TTL_SEC", "600"))  # picks up question edits made by other workers / in the DB
+RECORDS_CACHE_MAX       = int(os.getenv("RECORDS_CACHE_MAX", "500"))   # classes kept aggregated
+RECORDS_CACHE_TTL_SEC   = int(os.getenv("RECORDS_CACHE_TTL_SEC", "3600"))  # rebuild from the DB at least this often
+EXPORT_PAGE_SIZE        = int(os.getenv("EXPORT_PAGE_SIZE", "500"))  # rows fetched per query while streaming an export
+
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set in env")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-app = FastAPI(title="Inquizitive Backend (FastAPI)")
+
+# ---- Async data access -----------------------------------------------------
+# The supabase client is sync; building a query is pure Python, only .execute()
+# does I/O. Async routes hand that call to a bounded pool so a slow query never
+# stalls the event loop:  rows = (await adb(supabase.table("x").select("*"))).data
+#
+# Worker pools are created on first use and dropped by the lifespan shutdown,
+# the same way as the HTTP clients below, so a later lifespan in the same
+# process (TestClient reuse, in-process reload) gets fresh ones.
+_POOL_SIZES = {"supabase": DB_POOL_SIZE, "ocr": OCR_WORKERS, "pdfpage": PDF_OCR_PAGE_CONCURRENCY}
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+def _pool(name: str) -> ThreadPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = ThreadPoolExecutor(max_workers=_POOL_SIZES[name], thread_name_prefix=name)
+        return pool
+
+def _shutdown_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+async def adb(query):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool("supabase"), query.execute)
+
+async def adb_run(fn, *args):
+    # same pool, for sync helpers that run several queries in sequence
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool("supabase"), fn, *args)
+
+# ---- Shared HTTP clients ---------------------------------------------------
+# Created once in the lifespan handler so every AI/auth call reuses warm
+# keep-alive (and HTTP/2) connections instead of paying a new TLS handshake.
+_HTTP_TIMEOUTS = {"ai": AI_GENERATE_TIMEOUT_SEC, "auth": AUTH_TIMEOUT_SEC}
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+
+def _new_http_client(upstream: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2_ENABLED,
+        timeout=httpx.Timeout(_HTTP_TIMEOUTS[upstream], connect=10.0),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+def _http(upstream: str) -> httpx.AsyncClient:
+    # lazily created as well, so scripts that never run the lifespan still work
+    client = _http_clients.get(upstream)
+    if client is None or client.is_closed:
+        client = _http_clients[upstream] = _new_http_client(upstream)
+    return client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for upstream in _HTTP_TIMEOUTS:
+        _http(upstream)
+    try:
+        yield
+    finally:
+        for client in list(_http_clients.values()):
+            await client.aclose()
+        _http_clients.clear()
+        _shutdown_pools()
+
+app = FastAPI(title="Inquizitive Backend (FastAPI)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -52,6 +201,15 @@ app.add_middleware(
 )
 
 ALLOWED_TABLES = {"profiles", "quizzes", "classes", "questions", "question_options", "results"}  # students + class_students have dedicated flows
+TABLE_PK = {  # single-column keys; results/class_students are composite
+    "profiles": "user_id",
+    "classes": "class_id",
+    "quizzes": "quiz_id",
+    "questions": "question_id",
+    "question_options": "option_id",
+}
+PAGE_DEFAULT = 50   # page size when a cursor arrives without a limit
+PAGE_MAX     = 500
 
 def now_iso():
     return datetime.utcnow().isoformat()
@@ -110,6 +268,97 @@ def _quiz_ids_for_class(cid: int):
           .execute().data or [])
     return rs, [q["quiz_id"] for q in rs]
 
+# ---- Keyset pagination ----
+# Lists page on their existing sort key plus the primary key as tie-breaker,
+# e.g. (created_at desc, quiz_id desc); the cursor is the last row's pair,
+# opaque to clients. Conditions are PostgREST logic-tree strings so keyset and
+# search can share the single `or` parameter (see _apply_conds).
+def _encode_cursor(scope: str, values: List[Any]) -> str:
+    raw = json.dumps([scope, *values], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(scope: str, cursor: str, n: int) -> List[Any]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        ok = isinstance(data, list) and len(data) == n + 1 and data[0] == scope
+    except Exception:
+        ok = False
+    if not ok:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return data[1:]
+
+def _pgrst_value(v) -> str:
+    return '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _keyset_cond(sort_col: str, pk_col: str, after: List[Any]) -> str:
+    """Rows after `after` = [sort_value, pk] in (sort_col desc, pk_col desc) order (nulls first)."""
+    sv, pv = after
+
+    def past(col, v):  # strictly later in desc-nulls-first order
+        return f"{col}.not.is.null" if v is None else f"{col}.lt.{_pgrst_value(v)}"
+
+    def same(col, v):
+        return f"{col}.is.null" if v is None else f"{col}.eq.{_pgrst_value(v)}"
+
+    return f"or({past(sort_col, sv)},and({same(sort_col, sv)},{past(pk_col, pv)}))"
+
+def _like_literal(v) -> str:
+    # LIKE wildcards in user text match themselves (PostgREST's own `*` is stripped by callers)
+    return re.sub(r"([\\%_])", r"\\\1", str(v))
+
+def _prefix_cond(cols: List[str], prefix: str) -> Optional[str]:
+    p = re.sub(r'[*%"\\(),]', "", (prefix or "").strip())
+    if not p:
+        return None
+    return "or(" + ",".join(f"{c}.ilike.{_pgrst_value(_like_literal(p) + '*')}" for c in cols) + ")"
+
+def _apply_conds(query, conds: List[Optional[str]]):
+    conds = [c for c in conds if c]
+    return query.or_(f"and({','.join(conds)})") if conds else query
+
+def _page(rows: List[Dict[str, Any]], limit: Optional[int], scope: str, key) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Callers fetch limit + 1 rows; the extra one only tells us a next page exists."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _encode_cursor(scope, key(rows[-1]))
+
+# ---- Row counts without shipping the counted rows ----
+# Preferred: PostgREST embedded counts (`*, results(count)`), one request for
+# the whole listing. Needs a foreign key between the tables; if the embed is
+# rejected we remember that and fall back to one HEAD count per id.
+_embed_counts_ok: Dict[str, bool] = {}
+
+def _select_with_counts(build, relations: List[str], cols: str = "*"):
+    """
+    `build(select_cols)` returns the list query. Returns (rows, counts) where
+    counts is {relation: {row_index: n}}, or (rows, None) when embedding is
+    unavailable and the caller has to count another way.
+    """
+    key = ",".join(relations)
+    if _embed_counts_ok.get(key, True):
+        try:
+            rows = build(cols + ", " + ", ".join(f"{rel}(count)" for rel in relations)).execute().data or []
+            counts = {rel: {} for rel in relations}
+            for i, row in enumerate(rows):
+                for rel in relations:
+                    v = row.pop(rel, None) or [{}]
+                    counts[rel][i] = int((v[0] if isinstance(v, list) else v).get("count") or 0)
+            _embed_counts_ok[key] = True
+            return rows, counts
+        except Exception as e:
+            print("[COUNTS] embedded count unavailable, using per-id counts:", e)
+            if "PGRST200" in str(e) or "relationship" in str(e):  # schema, not a blip: stop trying
+                _embed_counts_ok[key] = False
+    return build(cols).execute().data or [], None
+
+def _counts_by(table: str, column: str, ids: List[int]) -> Dict[int, int]:
+    """{id: rows in `table` with column == id}; HEAD requests, run side by side on the DB pool."""
+    def one(i):
+        r = supabase.table(table).select(column, count="exact", head=True).eq(column, i).execute()
+        return i, int(r.count or 0)
+    return dict(_pool("supabase").map(one, list(dict.fromkeys(ids))))
+
 def normalize_q_type(raw_type: Optional[str]) -> str:
     if not raw_type:
         return "short"
@@ -121,6 +370,66 @@ def normalize_q_type(raw_type: Optional[str]) -> str:
     }
     return mapping.get(t, "short")
 
+class TTLCache:
+    """
+    Bounded LRU map whose entries also expire after `ttl` seconds (per-entry
+    override on set). Thread-safe, since sync routes run in the threadpool.
+    Every instance registers itself in CACHES so /cache/stats can report it.
+    """
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name, self.maxsize, self.ttl = name, maxsize, ttl
+        self.hits = self.misses = 0
+        self.coalesced = 0  # misses answered by another caller's in-flight fetch
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        CACHES[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or hit[0] <= time.time():
+                if hit is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return hit[1]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            hit = self._data.pop(key, None)
+        if hit is None or hit[0] <= time.time():
+            return default  # expired entries are as good as missing
+        return hit[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self) -> List[Tuple[Any, Any]]:
+        now = time.time()
+        with self._lock:
+            return [(k, v) for k, (exp, v) in self._data.items() if exp > now]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data), "maxsize": self.maxsize, "ttl_sec": self.ttl,
+            "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+CACHES: Dict[str, TTLCache] = {}
+
 # Treat empty string like None (defensive updates)
 def _none_if_blank(v):
     if v is None:
@@ -147,53 +456,373 @@ def _setup_tesseract_cmd():
             pytesseract.pytesseract.tesseract_cmd = p
             break
 
-def _ocr_image_bytes(raw: bytes) -> str:
+# Every pytesseract call already runs in its own tesseract process, so a thread
+# pool is enough to keep all cores busy -- and unlike a process pool it never
+# has to pickle the (large) upscaled variants across to a worker. One thread
+# per tesseract also means tesseract's own OpenMP threading only oversubscribes.
+# The pool itself is _pool("ocr"), sized by OCR_WORKERS.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+_OCR_CONFIGS = ["--oem 1 --psm 6", "--oem 1 --psm 11", "--oem 1 --psm 4"]
+_OCR_VARIANTS = ["gray", "bin150", "bin130", "inv", "inv_bin150"]
+# Adaptive order: the pairs that win most often on phone photos/scans go
+# first, then the rest of the grid. Attempts run in waves of these sizes
+# (remaining attempts form the last wave) and stop once a wave clears
+# OCR_CONFIDENCE_TARGET.
+_OCR_PRIORITY = [("gray", "--oem 1 --psm 6"), ("bin150", "--oem 1 --psm 6"), ("gray", "--oem 1 --psm 4")]
+_OCR_WAVES = (1, 2)
+
+# ---- OCR engines -------------------------------------------------------------
+# Both engines expose the same two calls: plain text, and (text, [(word, conf)]).
+def _parse_tess_config(cfg: str) -> Tuple[int, int]:
+    oem = re.search(r"--oem\s+(\d+)", cfg or "")
+    psm = re.search(r"--psm\s+(\d+)", cfg or "")
+    return (int(oem.group(1)) if oem else 1), (int(psm.group(1)) if psm else 3)
+
+class _PytesseractEngine:
+    """One tesseract subprocess per call: temp files + model load every time."""
+    name = "pytesseract"
+
+    def text(self, img, langs: str, cfg: str) -> str:
+        return pytesseract.image_to_string(img, lang=langs, config=cfg, timeout=OCR_ATTEMPT_TIMEOUT_SEC) or ""
+
+    def words(self, img, langs: str, cfg: str) -> Tuple[str, List[Tuple[str, float]]]:
+        data = pytesseract.image_to_data(
+            img, lang=langs, config=cfg, timeout=OCR_ATTEMPT_TIMEOUT_SEC, output_type=pytesseract.Output.DICT
+        )
+        lines: Dict[Tuple[int, int, int], List[str]] = {}
+        words: List[Tuple[str, float]] = []
+        for i, word in enumerate(data.get("text") or []):
+            word = (word or "").strip()
+            try:
+                conf = float(data["conf"][i])
+            except (TypeError, ValueError):
+                conf = -1.0
+            if not word or conf < 0:
+                continue
+            lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word)
+            words.append((word, conf))
+        return "\n".join(" ".join(ws) for _, ws in sorted(lines.items())), words
+
+class _TesserocrEngine:
+    """
+    Keeps one initialised TessBaseAPI per (thread, lang, oem) for the life of
+    the worker; only the page-seg mode changes between attempts. Threads of
+    the OCR pool each get their own API, since an API isn't thread-safe.
+    """
+    name = "tesserocr"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _api(self, langs: str, cfg: str):
+        oem, psm = _parse_tess_config(cfg)
+        apis = self._local.__dict__.setdefault("apis", {})
+        api = apis.get((langs, oem))
+        if api is None:
+            api = apis[(langs, oem)] = tesserocr.PyTessBaseAPI(lang=langs, oem=oem)
+        api.SetPageSegMode(psm)
+        return api
+
+    def _recognize(self, img, langs: str, cfg: str):
+        api = self._api(langs, cfg)
+        api.SetImage(img.convert("L") if img.mode == "1" else img)
+        if not api.Recognize(int(OCR_ATTEMPT_TIMEOUT_SEC * 1000)):
+            raise RuntimeError(f"tesserocr timed out after {OCR_ATTEMPT_TIMEOUT_SEC}s")
+        return api
+
+    def text(self, img, langs: str, cfg: str) -> str:
+        return self._recognize(img, langs, cfg).GetUTF8Text() or ""
+
+    def words(self, img, langs: str, cfg: str) -> Tuple[str, List[Tuple[str, float]]]:
+        api = self._recognize(img, langs, cfg)
+        words = [(w.strip(), float(c)) for w, c in api.MapWordConfidences() if (w or "").strip() and c >= 0]
+        return api.GetUTF8Text() or "", words
+
+def _make_ocr_engine(kind: str):
+    if kind == "pytesseract":
+        return _PytesseractEngine()
+    if tesserocr is not None:
+        return _TesserocrEngine()
+    if kind == "tesserocr":
+        print("[OCR] tesserocr not installed, using pytesseract")
+    return _PytesseractEngine()
+
+_ocr_engine = _make_ocr_engine(OCR_ENGINE)
+
+def _ocr_attempt(img, langs: str, cfg: str) -> str:
+    txt = _ocr_engine.text(img, langs, cfg)
+    return re.sub(r"[^\S\r\n]+", " ", txt).strip()
+
+def _ocr_attempt_scored(img, langs: str, cfg: str) -> Tuple[str, float, float]:
+    """
+    Returns (text, mean word confidence, score) from one recognition pass.
+    score = confidence-weighted word characters, i.e. the old "most word
+    characters" metric discounted by how sure tesseract was of each word.
+    """
+    text, words = _ocr_engine.words(img, langs, cfg)
+    score = sum(conf / 100.0 * len(re.sub(r"\W", "", w)) for w, conf in words)
+    mean_conf = (sum(c for _, c in words) / len(words)) if len(words) >= OCR_MIN_WORDS else 0.0
+    return re.sub(r"[^\S\r\n]+", " ", text).strip(), mean_conf, score
+
+# Variants are 256-entry lookup tables applied to the enhanced grayscale base
+# (a single C pass each, no per-pixel Python), built only when an attempt needs
+# them. inv_bin150 is "invert then threshold at 150" folded into one table.
+def _threshold_lut(th: int, invert: bool = False) -> List[int]:
+    return [(0 if (255 - x if invert else x) < th else 255) for x in range(256)]
+
+_OCR_VARIANT_LUTS: Dict[str, Optional[Tuple[List[int], str]]] = {
+    "gray": None,
+    "bin150": (_threshold_lut(150), "1"),
+    "bin130": (_threshold_lut(130), "1"),
+    "inv": ([255 - x for x in range(256)], "L"),
+    "inv_bin150": (_threshold_lut(150, invert=True), "1"),
+}
+
+def _ocr_variant(gray, name: str):
+    lut = _OCR_VARIANT_LUTS[name]
+    return gray if lut is None else gray.point(*lut)
+
+def _ocr_scale(img) -> float:
+    """
+    Resample toward OCR_TARGET_DPI (using the image's own dpi when present)
+    but never past OCR_MAX_PIXELS: a screenshot still gets the old 300/96
+    upscale, a 12 MP phone photo is left at (or brought down to) the budget.
+    """
+    w, h = img.size
+    dpi = img.info.get("dpi")
     try:
-        img = Image.open(BytesIO(raw))
-        try:
-            img = ImageOps.exif_transpose(img)
-        except Exception:
-            pass
+        src_dpi = float(dpi[0]) if dpi and float(dpi[0]) > 1 else OCR_ASSUMED_DPI
+    except (TypeError, ValueError):
+        src_dpi = OCR_ASSUMED_DPI
+    scale = OCR_TARGET_DPI / src_dpi
+    return min(scale, (OCR_MAX_PIXELS / float(max(1, w * h))) ** 0.5)
+
+def _ocr_base(img):
+    """Orientation fix, resample and enhancement; returns the grayscale base image."""
+    scale = _ocr_scale(img)
+    w, h = img.size
+    target = (max(1, int(w * scale)), max(1, int(h * scale)))
+    if scale < 1 and img.format == "JPEG":
+        img.draft("RGB", target)  # let libjpeg decode at 1/2, 1/4, 1/8 instead of full size
+    try:
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        pass
 
-        if img.mode not in ("RGB", "L"):
-            img = img.convert("RGB")
-        w, h = img.size
-        scale = 300 / 96.0
-        img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+    gray = img.convert("L")  # enhance one channel instead of three
+    # draft/exif may have shrunk or rotated it; match the target pixel count
+    gw, gh = gray.size
+    factor = ((target[0] * target[1]) / float(gw * gh)) ** 0.5
+    if abs(factor - 1.0) > 0.01:
+        gray = gray.resize((max(1, int(gw * factor)), max(1, int(gh * factor))), Image.LANCZOS)
 
-        img = ImageEnhance.Contrast(img).enhance(1.8)
-        img = ImageEnhance.Brightness(img).enhance(1.05)
-        img = ImageEnhance.Sharpness(img).enhance(1.2)
+    gray = ImageEnhance.Contrast(gray).enhance(1.8)
+    gray = ImageEnhance.Brightness(gray).enhance(1.05)
+    gray = ImageEnhance.Sharpness(gray).enhance(1.2)
+    return gray
 
-        gray = img.convert("L")
-        def binarize(im, th): return im.point(lambda x: 0 if x < th else 255, "1")
-        variants = [gray, binarize(gray, 150), binarize(gray, 130), ImageOps.invert(gray), binarize(ImageOps.invert(gray), 150)]
+def _ocr_run(gray, attempts: List[Tuple[str, str]], langs: str, fn) -> List[Any]:
+    """
+    Runs fn(variant_img, langs, cfg) for each (variant, cfg) on the OCR pool,
+    holding at most OCR_VARIANTS_IN_FLIGHT variant images at a time. Results
+    (or the exception) come back aligned with `attempts`.
+    """
+    names = list(dict.fromkeys(v for v, _ in attempts))
+    out: List[Any] = [None] * len(attempts)
+    for k in range(0, len(names), max(1, OCR_VARIANTS_IN_FLIGHT)):
+        window = names[k:k + max(1, OCR_VARIANTS_IN_FLIGHT)]
+        imgs = {v: _ocr_variant(gray, v) for v in window}
+        futs = [(i, _pool("ocr").submit(fn, imgs[v], langs, cfg)) for i, (v, cfg) in enumerate(attempts) if v in imgs]
+        del imgs  # pool tasks keep their own reference until they finish
+        for i, fut in futs:
+            try:
+                out[i] = fut.result()  # pytesseract enforces the per-attempt timeout
+            except Exception as e:
+                out[i] = e
+    return out
+
+def _ocr_grid(gray, langs: str) -> str:
+    attempts = [(v, cfg) for v in _OCR_VARIANTS for cfg in _OCR_CONFIGS]
 
+    # same winner as the old serial loop: most word chars, first one on ties
+    best = ""
+    for (_, cfg), txt in zip(attempts, _ocr_run(gray, attempts, langs, _ocr_attempt)):
+        if isinstance(txt, Exception):
+            print("[OCR] config failed:", cfg, txt)
+            continue
+        if len(re.sub(r"\W", "", txt)) > len(re.sub(r"\W", "", best)):
+            best = txt
+    return best
+
+def _ocr_adaptive(gray, langs: str) -> str:
+    order = list(_OCR_PRIORITY) + [(v, c) for v in _OCR_VARIANTS for c in _OCR_CONFIGS if (v, c) not in _OCR_PRIORITY]
+    waves, start = [], 0
+    for size in _OCR_WAVES:
+        waves.append(order[start:start + size])
+        start += size
+    waves.append(order[start:])
+
+    best, best_conf, best_score = "", 0.0, -1.0
+    for wave in waves:
+        for (_, cfg), res in zip(wave, _ocr_run(gray, wave, langs, _ocr_attempt_scored)):
+            if isinstance(res, Exception):
+                print("[OCR] config failed:", cfg, res)
+                continue
+            txt, conf, score = res
+            if score > best_score:
+                best, best_conf, best_score = txt, conf, score
+        if best_conf >= OCR_CONFIDENCE_TARGET:
+            break
+    return best
+
+def _ocr_image(img, strategy: Optional[str] = None) -> str:
+    try:
+        gray = _ocr_base(img)
         langs = os.getenv("TESSERACT_LANG", "eng")
-        configs = ["--oem 1 --psm 6", "--oem 1 --psm 11", "--oem 1 --psm 4"]
-
-        best = ""
-        for v in variants:
-            for cfg in configs:
-                try:
-                    txt = pytesseract.image_to_string(v, lang=langs, config=cfg) or ""
-                    txt = re.sub(r"[^\S\r\n]+", " ", txt).strip()
-                    if len(re.sub(r"\W", "", txt)) > len(re.sub(r"\W", "", best)):
-                        best = txt
-                except Exception as e:
-                    print("[OCR] config failed:", cfg, e)
-        return best
+        if (strategy or OCR_STRATEGY) == "grid":
+            return _ocr_grid(gray, langs)
+        return _ocr_adaptive(gray, langs)
     except Exception as e:
         print("[OCR] fatal:", e)
         return ""
 
+def _ocr_image_bytes(raw: bytes, strategy: Optional[str] = None) -> str:
+    try:
+        img = Image.open(BytesIO(raw))
+    except Exception as e:
+        print("[OCR] fatal:", e)
+        return ""
+    return _ocr_image(img, strategy)
+
+def _ocr_pdf_page(path: str, page_no: int) -> str:
+    imgs = convert_from_path(path, dpi=PDF_OCR_DPI, first_page=page_no, last_page=page_no)
+    try:
+        if not imgs:
+            return ""
+        imgs[0].info["dpi"] = (PDF_OCR_DPI, PDF_OCR_DPI)  # already at print resolution: no upscale
+        return _ocr_image(imgs[0])
+    finally:
+        for im in imgs:
+            im.close()
+
+def _ocr_pdf_pages(contents: bytes, page_nos: List[int], errors: Optional[List[Exception]] = None) -> Dict[int, str]:
+    """
+    OCRs the given 1-based pages, rasterising one page per task with
+    PDF_OCR_PAGE_CONCURRENCY tasks in flight, so memory stays at a few pages.
+    A page that fails (no poppler, bad raster, OCR error) is logged, left out
+    of the result and appended to `errors`; the other pages still count.
+    """
+    if len(page_nos) > PDF_OCR_MAX_PAGES:
+        print(f"[OCR] {len(page_nos)} pages need OCR, limited to the first {PDF_OCR_MAX_PAGES}")
+        page_nos = page_nos[:PDF_OCR_MAX_PAGES]
+    if not page_nos:
+        return {}
+    # one temp copy for every pdftoppm call (convert_from_bytes would write one per call);
+    # closed before use so Windows poppler can open it too
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(contents)
+        futs = {p: _pool("pdfpage").submit(_ocr_pdf_page, path, p) for p in page_nos}
+        out: Dict[int, str] = {}
+        for p, fut in futs.items():
+            try:
+                out[p] = fut.result()
+            except Exception as e:
+                print(f"[OCR] page {p} failed:", e)
+                if errors is not None:
+                    errors.append(e)
+        return out
+    finally:
+        os.remove(path)
+
+def _has_text_layer(t: str) -> bool:
+    return len(re.findall(r"[A-Za-z0-9]", t or "")) >= PDF_MIN_PAGE_CHARS
+
+def _extract_pdf_text(contents: bytes) -> str:
+    """
+    Per-page hybrid: pdfplumber text where the page has a usable text layer,
+    OCR only for the pages that don't (scans, image slides). Page order kept.
+    """
+    with pdfplumber.open(BytesIO(contents)) as pdf_file:
+        page_texts = [(page.extract_text() or "") for page in pdf_file.pages]
+
+    need_ocr = [i + 1 for i, t in enumerate(page_texts) if not _has_text_layer(t)]
+    errors: List[Exception] = []
+    ocr_texts = _ocr_pdf_pages(contents, need_ocr, errors)
+
+    content_text = ""
+    for i, t in enumerate(page_texts):
+        txt = ocr_texts.get(i + 1) or t  # keep a thin text layer if OCR found nothing better
+        if txt and txt.strip():
+            content_text += txt + "\n"
+    if not content_text and errors:
+        raise errors[0]  # nothing usable at all: surface why (e.g. poppler missing)
+    return content_text
+
+# ---- Extracted-text cache ----------------------------------------------------
+# preview=1 and the real commit upload the same file twice; key the raw
+# extraction on the bytes plus every setting that changes OCR output.
+_extract_cache = TTLCache("extracted_text", EXTRACT_CACHE_MAX, EXTRACT_CACHE_TTL_SEC)
+
+def _extract_cache_key(kind: str, raw: bytes) -> str:
+    settings = json.dumps([
+        kind, OCR_STRATEGY, _ocr_engine.name, os.getenv("TESSERACT_LANG", "eng"),
+        OCR_CONFIDENCE_TARGET, OCR_TARGET_DPI, OCR_ASSUMED_DPI, OCR_MAX_PIXELS,
+        PDF_OCR_DPI, PDF_OCR_MAX_PAGES, PDF_MIN_PAGE_CHARS,
+    ])
+    h = hashlib.sha256(raw)
+    h.update(settings.encode("utf-8"))
+    return h.hexdigest()
+
+def _extract_upload_text(kind: str, raw: bytes) -> str:
+    """Text of an uploaded "pdf" or "image", served from cache when the same bytes were seen before."""
+    key = _extract_cache_key(kind, raw)
+    text = _extract_cache.get(key)
+    if text is not None:
+        return text
+
+    disk_path = os.path.join(EXTRACT_CACHE_DIR, key + ".txt") if EXTRACT_CACHE_DIR else None
+    if disk_path:
+        try:
+            if time.time() - os.path.getmtime(disk_path) < EXTRACT_CACHE_TTL_SEC:
+                with open(disk_path, "r", encoding="utf-8") as f:
+                    text = f.read()
+        except FileNotFoundError:
+            text = None
+        except (OSError, UnicodeDecodeError) as e:  # unreadable/corrupt file: just a miss
+            print("[EXTRACT] disk cache read failed:", e)
+            text = None
+        if text and text.strip():  # only non-empty text is ever written
+            _extract_cache.set(key, text)
+            return text
+
+    text = _extract_pdf_text(raw) if kind == "pdf" else _ocr_image_bytes(raw)
+    if text and text.strip():  # an empty result may just be a missing tesseract/poppler
+        _extract_cache.set(key, text)
+        if disk_path:
+            try:
+                os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+                tmp_path = disk_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, disk_path)
+            except OSError as e:
+                print("[EXTRACT] disk cache write failed:", e)
+    return text
+
 # =========================
 # AI Calls
 # =========================
-def call_ai_generate(topic=None, pdf_text=None, n_questions=5, format_type="mcq", retries=2):
+def _mixed_split(n_questions: int) -> Tuple[int, int]:
+    """(mcq, short) for a mixed set: roughly 70/30, at least one MCQ."""
+    mcq_count = max(1, round(n_questions * 0.7))
+    return mcq_count, n_questions - mcq_count
+
+async def call_ai_generate(topic=None, pdf_text=None, n_questions=5, format_type="mcq", retries=2):
     if format_type == "mixed":
-        mcq_count = max(1, round(n_questions * 0.7))
-        short_count = n_questions - mcq_count
+        mcq_count, short_count = _mixed_split(n_questions)
         prompt_text = f"""
 Generate exactly {n_questions} questions from the given content.
 
@@ -230,7 +859,7 @@ Content:
     payload = {"model": "models/gemini-2.5-flash", "contents": [{"parts": [{"text": prompt_text}]}]}
 
     for _ in range(retries + 1):
-        resp = requests.post(AI_API_URL, headers=headers, json=payload, timeout=120)
+        resp = await _http("ai").post(AI_API_URL, headers=headers, json=payload, timeout=AI_GENERATE_TIMEOUT_SEC)
         if resp.status_code != 200:
             raise HTTPException(status_code=500, detail=f"AI API Error: {resp.text}")
 
@@ -261,11 +890,199 @@ Content:
 
     raise HTTPException(status_code=500, detail="AI could not generate enough valid questions.")
 
+# ---- Chunked generation planner --------------------------------------------
+def _split_by_length(chunks: List[str], n: int) -> List[int]:
+    # question k sits at the midpoint (k + 0.5) * total / n of the document and
+    # goes to the chunk holding that point: picks spread over the whole text,
+    # and a few-char tail from the 800-char slicing never gets one of its own
+    total = sum(len(c) for c in chunks) or 1
+    out, cum, prev = [], 0, 0
+    for c in chunks:
+        cum += len(c)
+        now = (2 * n * cum + total) // (2 * total)
+        out.append(now - prev)
+        prev = now
+    return out
+
+def _question_bucket(q: dict, format_type: str) -> str:
+    if format_type != "mixed":
+        return "all"
+    return "short" if normalize_q_type(q.get("type")) == "short" else "mcq"
+
+def _generation_quota(n_questions: int, format_type: str) -> Dict[str, int]:
+    if format_type != "mixed":
+        return {"all": n_questions}
+    mcq_count, short_count = _mixed_split(n_questions)
+    return {"mcq": mcq_count, "short": short_count}
+
+def _plan_chunk_counts(chunks: List[str], n_questions: int, format_type: str) -> List[Tuple[Dict[str, int], int]]:
+    """
+    Splits n_questions across chunks proportionally to their length and
+    returns (quota, ask) per chunk, quota being {bucket: questions to keep}.
+    Mixed quizzes plan their MCQ and short quotas separately over the whole
+    quiz, so a chunk's small mixed set can't tilt the overall split. `ask`
+    adds a small over-ask so a chunk that comes back short can be covered by
+    its neighbours' extras.
+    """
+    per_bucket = {b: _split_by_length(chunks, n) for b, n in _generation_quota(n_questions, format_type).items()}
+    plan = []
+    for i in range(len(chunks)):
+        quota = {b: counts[i] for b, counts in per_bucket.items()}
+        keep = sum(quota.values())
+        ask = keep + math.ceil(keep * GENERATE_OVER_ASK) if keep else 0
+        if keep and format_type == "mixed":
+            ask = max(ask, 2)  # a mixed ask only yields a short question from 2 up
+        plan.append((quota, ask))
+    return plan
+
+async def generate_from_chunks(chunks: List[str], n_questions: int, format_type: str) -> List[dict]:
+    sem = asyncio.Semaphore(AI_GENERATE_CONCURRENCY)
+    plan = _plan_chunk_counts(chunks, n_questions, format_type)
+    targets = _generation_quota(n_questions, format_type)
+
+    async def run(chunk: str, ask: int):
+        async with sem:
+            return await call_ai_generate(pdf_text=chunk, n_questions=ask, format_type=format_type)
+
+    jobs = [(i, ask) for i, (_, ask) in enumerate(plan) if ask > 0]
+    outs = await asyncio.gather(*(run(chunks[i], ask) for i, ask in jobs), return_exceptions=True)
+    by_chunk: Dict[int, List[dict]] = {}
+    for (i, _), out in zip(jobs, outs):
+        if isinstance(out, Exception):
+            print("[GEN] chunk", i, "failed:", out)
+            continue
+        by_chunk[i] = out
+
+    # each chunk's own quota per type first (document order), then top each
+    # type up from its extras, then make up any remaining gap from either type
+    picked = {b: [] for b in targets}
+    extras = {b: [] for b in targets}
+    for i, _ in jobs:
+        quota = dict(plan[i][0])
+        for q in by_chunk.get(i, []):
+            b = _question_bucket(q, format_type)
+            if quota.get(b, 0) > 0:
+                quota[b] -= 1
+                picked[b].append(q)
+            else:
+                extras[b].append(q)
+    for b, want in targets.items():
+        gap = max(0, want - len(picked[b]))
+        picked[b].extend(extras[b][:gap])
+        extras[b] = extras[b][gap:]
+    questions = [q for b in targets for q in picked[b]]
+    leftovers = [q for b in targets for q in extras[b]]
+    questions.extend(leftovers[: max(0, n_questions - len(questions))])
+
+    # still short (failed/thin chunks): fall back to the old sequential fill
+    for chunk in chunks:
+        remaining = n_questions - len(questions)
+        if remaining <= 0:
+            break
+        try:
+            questions.extend(await call_ai_generate(pdf_text=chunk, n_questions=remaining, format_type=format_type))
+        except HTTPException as e:
+            print("[GEN] top-up failed:", e.detail)
+
+    if not questions:
+        errors = [o for o in outs if isinstance(o, Exception)]
+        if errors:
+            raise errors[0]
+    return questions[:n_questions]
+
 # ===================== AI short-answer scoring =====================
+# asyncio primitives bind to the loop that first waits on them, so keep one
+# semaphore per running loop (a second lifespan gets a fresh one), like _pool.
+_ai_grading_sems: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _ai_grading_sem() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _ai_grading_sems.get(loop)
+    if sem is None:
+        sem = _ai_grading_sems[loop] = asyncio.Semaphore(AI_GRADING_CONCURRENCY)
+    return sem
+
+# Grading is temperature 0 on lowercased/stripped text, so the score is a pure
+# function of (question, answer, max_marks): memoise it. Keyed on question text
+# rather than question_id so an edited question never serves a stale score.
+_grade_cache = TTLCache("grading", GRADE_CACHE_MAX, GRADE_CACHE_TTL_SEC)
+_grade_db_conn: Optional[sqlite3.Connection] = None
+_grade_db_lock = threading.Lock()
+
+def _grade_key(question_text: str, student_answer: str, max_marks: int) -> str:
+    norm = lambda t: re.sub(r"\s+", " ", (t or "").strip().lower())
+    raw = json.dumps([norm(question_text), norm(student_answer), int(max_marks)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _grade_db() -> Optional[sqlite3.Connection]:
+    global _grade_db_conn
+    if GRADE_CACHE_DB and _grade_db_conn is None:
+        _grade_db_conn = sqlite3.connect(GRADE_CACHE_DB, check_same_thread=False)
+        _grade_db_conn.execute(
+            "CREATE TABLE IF NOT EXISTS grade_cache (key TEXT PRIMARY KEY, score INTEGER, created_at REAL)"
+        )
+    return _grade_db_conn
+
+# The sqlite tier is best-effort: a locked or broken file is a miss / no-op,
+# never a reason to change the grade or fail the submission.
+def _grade_db_get(key: str) -> Optional[int]:
+    try:
+        with _grade_db_lock:
+            conn = _grade_db()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT score FROM grade_cache WHERE key = ? AND created_at > ?",
+                (key, time.time() - GRADE_CACHE_TTL_SEC),
+            ).fetchone()
+        return int(row[0]) if row else None
+    except (sqlite3.Error, ValueError, TypeError) as e:
+        print("[GRADE] cache read failed:", e)
+        return None
+
+def _grade_db_put(key: str, score: int):
+    try:
+        with _grade_db_lock:
+            conn = _grade_db()
+            if conn is None:
+                return
+            conn.execute("INSERT OR REPLACE INTO grade_cache VALUES (?, ?, ?)", (key, int(score), time.time()))
+            conn.commit()
+    except sqlite3.Error as e:
+        print("[GRADE] cache write failed:", e)
+
+async def _grade_cached(key: str) -> Optional[int]:
+    cached = _grade_cache.get(key)
+    if cached is not None:
+        return cached
+    if GRADE_CACHE_DB:
+        stored = await asyncio.to_thread(_grade_db_get, key)
+        if stored is not None:
+            _grade_cache.set(key, stored)
+            return stored
+    return None
+
+async def _grade_remember(key: str, score: int):
+    _grade_cache.set(key, score)
+    if GRADE_CACHE_DB:
+        await asyncio.to_thread(_grade_db_put, key, score)
+
+def _ai_text_output(ai_json: dict) -> str:
+    cand = (ai_json.get("candidates") or [{}])[0]
+    parts = (cand.get("content") or {}).get("parts") or []
+    if parts and "text" in parts[0]:
+        return (parts[0]["text"] or "").strip()
+    return ""
+
 async def call_ai_evaluate(question_text: str, student_answer: str, max_marks: int = 3) -> dict:
     question_text = (question_text or "").strip().lower()
     student_answer = (student_answer or "").strip().lower()
 
+    key = _grade_key(question_text, student_answer, max_marks)
+    cached = await _grade_cached(key)
+    if cached is not None:
+        return {"score": cached}
+
     prompt = (
         f"You are a strict examiner grading a student's short-answer response.\n\n"
         f"Question: {question_text}\n"
@@ -284,27 +1101,82 @@ async def call_ai_evaluate(question_text: str, student_answer: str, max_marks: i
     }
     headers = {"Content-Type": "application/json", "x-goog-api-key": AI_API_KEY.strip()}
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.post(AI_API_URL, json=payload, headers=headers)
-        resp.raise_for_status()
-        ai_json = resp.json()
-
-    text_output = ""
-    cand = (ai_json.get("candidates") or [{}])[0]
-    parts = (cand.get("content") or {}).get("parts") or []
-    if parts and "text" in parts[0]:
-        text_output = (parts[0]["text"] or "").strip()
+    resp = await _http("ai").post(AI_API_URL, json=payload, headers=headers, timeout=AI_EVALUATE_TIMEOUT_SEC)
+    resp.raise_for_status()
+    text_output = _ai_text_output(resp.json())
 
     try:
         cleaned = text_output.replace("```json", "").replace("```", "").strip()
         data = json.loads(cleaned)
         score = int(data.get("score", 0))
+        parsed = True
     except Exception:
         score = 0
+        parsed = False
 
     score = max(0, min(int(score), int(max_marks)))
+    if parsed:  # don't pin a garbled reply as the answer's grade
+        await _grade_remember(key, score)
     return {"score": score}
 
+async def call_ai_evaluate_batch(items: List[Dict[str, Any]], max_marks: int = 3) -> Dict[str, int]:
+    """
+    Grades several answers in one prompt. `items` are {"question_id", "question",
+    "answer"} with unique question_ids. Returns {str(question_id): score} for the
+    entries the model answered cleanly; anything missing or malformed is simply
+    absent so the caller can fall back to call_ai_evaluate for it.
+    """
+    entries = [
+        {
+            "question_id": str(it["question_id"]),
+            "question": (it.get("question") or "").strip().lower(),
+            "answer": (it.get("answer") or "").strip().lower(),
+        }
+        for it in items
+    ]
+    prompt = (
+        f"You are a strict examiner grading students' short-answer responses.\n\n"
+        f"Grade EACH item below independently.\n"
+        f"Rules:\n"
+        f"- Read each question carefully and check if the student's answer correctly responds to it.\n"
+        f"- Evaluate only factual/conceptual correctness.\n"
+        f"- 0 = wrong/irrelevant, {max_marks//2} = partial, {max_marks} = fully correct.\n"
+        f"- Return only a JSON array like [{{\"question_id\": \"<id>\", \"score\": <int>}}], one entry per item.\n\n"
+        f"Items:\n{json.dumps(entries, ensure_ascii=False)}\n"
+    )
+
+    payload = {
+        "model": "models/gemini-2.5-flash",
+        "generationConfig": {"temperature": 0.0, "top_p": 0.1, "top_k": 1},
+        "contents": [{"parts": [{"text": prompt}]}],
+    }
+    headers = {"Content-Type": "application/json", "x-goog-api-key": AI_API_KEY.strip()}
+
+    resp = await _http("ai").post(AI_API_URL, json=payload, headers=headers, timeout=AI_BATCH_TIMEOUT_SEC)
+    resp.raise_for_status()
+    text_output = _ai_text_output(resp.json())
+
+    cleaned = re.sub(r"```(?:json)?\s*([\s\S]*?)```", r"\1", text_output).strip()
+    m = re.search(r'(\[.*\]|\{.*\})', cleaned, flags=re.DOTALL)
+    try:
+        data = json.loads(m.group(1)) if m else []
+    except json.JSONDecodeError:
+        data = []
+    if isinstance(data, dict):
+        data = data.get("scores") or data.get("results") or []
+
+    wanted = {e["question_id"] for e in entries}
+    scores: Dict[str, int] = {}
+    for row in data if isinstance(data, list) else []:
+        try:
+            qid = str(row["question_id"])
+            score = int(row["score"])
+        except Exception:
+            continue
+        if qid in wanted and qid not in scores:
+            scores[qid] = max(0, min(score, int(max_marks)))
+    return scores
+
 # =========================
 # Exceptions
 # =========================
@@ -315,21 +1187,95 @@ async def runtime_exception_handler(request: Request, exc: RuntimeError):
 # =========================
 # Auth (teachers only; students are public)
 # =========================
+_auth_cache = TTLCache("auth", AUTH_CACHE_MAX, AUTH_CACHE_TTL_SEC)
+_jwks_client: Optional[jwt.PyJWKClient] = None
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _auth_cache_put(key: str, user: AuthedUser, exp: Optional[float]):
+    ttl = float(AUTH_CACHE_TTL_SEC)
+    if exp:
+        ttl = min(ttl, float(exp) - time.time())  # never outlive the token
+    if ttl > 0:
+        _auth_cache.set(key, user, ttl=ttl)
+
+async def _verify_token_locally(token: str) -> Optional[Tuple[AuthedUser, Optional[float]]]:
+    """
+    Checks signature/expiry/audience with PyJWT. Returns None when the token
+    can't be judged locally (no key configured, unknown alg, JWKS unreachable)
+    so the caller falls back to Supabase. Once a key is in hand, an invalid
+    token (bad signature, expired, wrong audience, missing claims, garbage)
+    is rejected here without a remote call.
+    """
+    global _jwks_client
+    try:
+        alg = jwt.get_unverified_header(token).get("alg") or ""
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    try:
+        if alg == "HS256":
+            if not SUPABASE_JWT_SECRET:
+                return None
+            key = SUPABASE_JWT_SECRET
+        elif alg in ("RS256", "ES256"):
+            if _jwks_client is None:
+                _jwks_client = jwt.PyJWKClient(f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json", cache_keys=True)
+            # key fetch is sync urllib; only hits the network on an unknown kid
+            key = (await asyncio.to_thread(_jwks_client.get_signing_key_from_jwt, token)).key
+        else:
+            return None
+    except Exception as e:
+        print("[AUTH] local verify unavailable, falling back:", e)
+        return None
+    try:
+        claims = jwt.decode(
+            token, key, algorithms=[alg], audience=SUPABASE_JWT_AUD,
+            options={"require": ["exp", "sub"]},
+        )
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:  # e.g. a key PyJWT can't use for this alg
+        print("[AUTH] local verify unavailable, falling back:", e)
+        return None
+    return AuthedUser(user_id=claims["sub"], email=claims.get("email")), claims.get("exp")
+
+async def _verify_token_remote(token: str) -> AuthedUser:
+    url = f"{SUPABASE_URL}/auth/v1/user"
+    headers = {"Authorization": f"Bearer {token}", "apikey": SUPABASE_KEY}
+    r = await _http("auth").get(url, headers=headers)
+    if r.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    data = r.json()
+
+    return AuthedUser(user_id=data["id"], email=data.get("email"))
+
+def _unverified_exp(token: str) -> Optional[float]:
+    try:
+        return jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except Exception:
+        return None
+
 async def get_current_user(request: Request) -> AuthedUser:
     auth = request.headers.get("Authorization", "")
     if not auth.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing bearer token")
     token = auth.split(" ", 1)[1]
 
-    url = f"{SUPABASE_URL}/auth/v1/user"
-    headers = {"Authorization": f"Bearer {token}", "apikey": SUPABASE_KEY}
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.get(url, headers=headers)
-        if r.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
-        data = r.json()
+    key = _token_key(token)
+    cached = _auth_cache.get(key)
+    if cached:
+        return cached
 
-    return AuthedUser(user_id=data["id"], email=data.get("email"))
+    local = await _verify_token_locally(token)
+    if local and not AUTH_REMOTE_ON_MISS:
+        user, exp = local
+    else:
+        user = await _verify_token_remote(token)
+        exp = local[1] if local else _unverified_exp(token)
+
+    _auth_cache_put(key, user, exp)
+    return user
 
 @app.get("/me")
 async def me(user: AuthedUser = Depends(get_current_user)):
@@ -573,101 +1519,324 @@ QUESTION_WEIGHT = {
     "true_false": 1,
     "short_answer": 3,
 }
+
+# Quiz totals only change when a quiz's questions do, so they are computed on
+# create (or first sight) and cached per process: quiz_id -> {"total", "breakdown"}.
+# The TTL bounds staleness from edits this process didn't see.
+# With QUIZ_TOTALS_COLUMNS=1 they are also stored on the quiz row.
+_quiz_totals = TTLCache("quiz_totals", QUIZ_TOTALS_CACHE_MAX, QUIZ_TOTALS_TTL_SEC)
+
+def _quiz_marks(question_types: List[Optional[str]]) -> Dict[str, Any]:
+    """Total marks plus {question_type: {"count", "marks"}} for one quiz."""
+    breakdown: Dict[str, Dict[str, int]] = {}
+    for raw in question_types:
+        qtype = (raw or "").strip().lower()
+        weight = QUESTION_WEIGHT.get(qtype, 1)  # default 1 if unknown
+        b = breakdown.setdefault(qtype or "unknown", {"count": 0, "marks": 0})
+        b["count"] += 1
+        b["marks"] += int(weight)
+    return {"total": sum(b["marks"] for b in breakdown.values()), "breakdown": breakdown}
+
+def _remember_quiz_totals(quiz_id: int, marks: Dict[str, Any], persist: bool = False):
+    _quiz_totals.set(int(quiz_id), marks)
+    if persist and QUIZ_TOTALS_COLUMNS:
+        supabase.table("quizzes").update({
+            "total_marks": marks["total"],
+            "marks_breakdown": marks["breakdown"],
+        }).eq("quiz_id", quiz_id).execute()
+
+def _forget_quiz_totals(quiz_id: Optional[int] = None):
+    if quiz_id is None:
+        _quiz_totals.clear()
+    else:
+        _quiz_totals.pop(int(quiz_id))
+
+def _load_quiz_totals(qids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Stored columns first (when enabled), then one questions scan for the rest."""
+    found: Dict[int, Dict[str, Any]] = {}
+    if QUIZ_TOTALS_COLUMNS:
+        rows = (supabase.table("quizzes")
+                .select("quiz_id, total_marks, marks_breakdown")
+                .in_("quiz_id", qids)
+                .execute().data or [])
+        for r in rows:
+            if r.get("total_marks") is not None:
+                found[r["quiz_id"]] = {"total": int(r["total_marks"]), "breakdown": r.get("marks_breakdown") or {}}
+    missing = [q for q in qids if q not in found]
+    if missing:
+        qs = (
+            supabase.table("questions")
+            .select("quiz_id, question_type")
+            .in_("quiz_id", missing)
+            .execute()
+            .data or []
+        )
+        types: Dict[int, List[Optional[str]]] = {q: [] for q in missing}
+        for row in qs:
+            types.setdefault(row.get("quiz_id"), []).append(row.get("question_type"))
+        for q, tlist in types.items():
+            found[q] = _quiz_marks(tlist)
+    return found
+
 def _build_quiz_totals(qids: List[int]) -> Dict[int, int]:
     """
-    Returns {quiz_id: total_marks} by summing weights of its questions.
-    Unknown types default to short_answer weight (conservative) OR 1 — here we use 1.
+    Returns {quiz_id: total_marks} (QUESTION_WEIGHT summed over its questions),
+    served from _quiz_totals; only quizzes not seen yet hit the database.
     """
     if not qids:
         return {}
-    qs = (
-        supabase.table("questions")
-        .select("quiz_id, question_type")
-        .in_("quiz_id", qids)
-        .execute()
-        .data or []
-    )
-    totals: Dict[int, int] = {}
+    known: Dict[int, int] = {}
+    for q in qids:
+        marks = _quiz_totals.get(q)
+        if marks is not None:
+            known[q] = marks["total"]
+    missing = [q for q in qids if q not in known]
+    if missing:
+        for q, marks in _load_quiz_totals(missing).items():
+            _remember_quiz_totals(q, marks)
+            known[q] = marks["total"]
+    return known
+
+def _refresh_quiz_totals(quiz_ids) -> None:
+    """Recomputes totals from the questions (and re-stores them, with QUIZ_TOTALS_COLUMNS=1)."""
+    ids = sorted({int(q) for q in quiz_ids if q is not None})
+    if not ids:
+        return
+    qs = (supabase.table("questions")
+          .select("quiz_id, question_type")
+          .in_("quiz_id", ids)
+          .execute().data or [])
+    types: Dict[int, List[Optional[str]]] = {i: [] for i in ids}
     for row in qs:
-        qid = row.get("quiz_id")
-        qtype = (row.get("question_type") or "").strip().lower()
-        weight = QUESTION_WEIGHT.get(qtype, 1)  # default 1 if unknown
-        totals[qid] = totals.get(qid, 0) + int(weight)
-    return totals
+        types.setdefault(row.get("quiz_id"), []).append(row.get("question_type"))
+    for qid, tlist in types.items():
+        _remember_quiz_totals(qid, _quiz_marks(tlist), persist=True)
 
-@app.get("/classes/{class_id}/records")
-def class_records(class_id: int):
-    sr = (supabase.table("class_students")
-        .select("student_id, full_name, seat_no, email, enrolled_at")
-        .eq("class_id", class_id)
-        .order("enrolled_at", desc=True)
-        .execute())
+def _questions_changed(rows) -> None:
+    # a generic write to `questions` changes its quiz's totals: recompute now so
+    # stored columns never outlive the questions they were summed from
+    try:
+        _refresh_quiz_totals(r.get("quiz_id") for r in (rows or []))
+    except Exception as e:
+        print("[TOTALS] refresh after question change failed:", e)
 
-    studs = sr.data or []
+def backfill_quiz_totals(page_size: int = 200) -> int:
+    """
+    Recomputes totals for every quiz from its questions, page by page; with
+    QUIZ_TOTALS_COLUMNS=1 the result is written to the quiz rows as well.
+    Returns the number of quizzes processed.
+    """
+    done, last_id = 0, None
+    while True:
+        q = supabase.table("quizzes").select("quiz_id").order("quiz_id").limit(page_size)
+        if last_id is not None:
+            q = q.gt("quiz_id", last_id)
+        ids = [r["quiz_id"] for r in (q.execute().data or [])]
+        if not ids:
+            return done
+        _refresh_quiz_totals(ids)
+        done += len(ids)
+        last_id = ids[-1]
+
+@app.post("/quizzes/totals/backfill")
+def backfill_quiz_totals_route():
+    return {"quizzes": backfill_quiz_totals()}
+
+# ---- Per-(class, seat) aggregates behind /classes/{id}/records ----
+# One entry per class:
+#   {"quizzes": {quiz_id: {"title", "total"}},
+#    "seats":   {SEAT: {"obtained", "possible", "last": {"quiz_id", "score", "date"} | None}}}
+# Built from the DB on first read (or after expiry / a rebuild), then kept
+# current by the routes that write results, so a page load no longer scans
+# every result row of the term. The expiry is the backstop for writes made
+# outside this process.
+_records_cache = TTLCache("class_records", RECORDS_CACHE_MAX, RECORDS_CACHE_TTL_SEC)
+_records_lock = threading.Lock()
+_records_epoch: Dict[Optional[int], int] = {}    # class_id (None = all) -> writes started
+_records_pending: Dict[Optional[int], int] = {}  # class_id (None = all) -> writes in progress
+
+def _records_seat_key(seat) -> str:
+    return (seat or "").upper()
+
+def _records_score(score) -> Optional[float]:
+    # the results column is numeric, so "5" posted to /results reads back as 5
+    if isinstance(score, bool):
+        return None
+    try:
+        return float(score) if score is not None else None
+    except (TypeError, ValueError):
+        return None
 
+def _records_add(state: Dict[str, Any], seat, quiz_id, score, submitted_at):
+    quiz = state["quizzes"].get(quiz_id)
+    if quiz is None:
+        return  # not one of this class's quizzes: never counted
+    score = _records_score(score)
+    agg = state["seats"].setdefault(_records_seat_key(seat), {"obtained": 0, "possible": 0, "last": None})
+    qtot = int(quiz["total"])
+    if qtot > 0 and score is not None:
+        agg["obtained"] += int(round(score))
+        agg["possible"] += qtot
+    last = agg["last"]
+    if last is None or (submitted_at or "") >= (last["date"] or ""):
+        agg["last"] = {"quiz_id": quiz_id, "score": int(round(score or 0)), "date": submitted_at}
+
+def _records_build(class_id: int) -> Dict[str, Any]:
     quizzes_rows, qids = _quiz_ids_for_class(class_id)
-    by_qid = {q["quiz_id"]: q for q in quizzes_rows}
-
-    # Build totals per quiz (actual marks)
     quiz_totals = _build_quiz_totals(qids)
-
-    results = []
+    state = {
+        "quizzes": {q["quiz_id"]: {"title": q.get("title"), "total": int(quiz_totals.get(q["quiz_id"], 0))}
+                    for q in quizzes_rows},
+        "seats": {},
+    }
     if qids:
         results = (supabase.table("results")
                    .select("quiz_id, score, submitted_at, seat_no")
                    .eq("class_id", class_id)
                    .in_("quiz_id", qids)
                    .execute().data or [])
-    by_seat: Dict[str, List[dict]] = {}
-    for r in results:
-        by_seat.setdefault((r.get("seat_no") or "").upper(), []).append(r)
-
-    fe, class_got_sum, class_tot_sum = [], 0, 0
-    for s in studs:
-        seat = (s.get("seat_no") or "").upper()
-        rlist = by_seat.get(seat, [])
-
-        # aggregate using actual totals
-        got_sum = 0
-        tot_sum = 0
-        for r in rlist:
-            qid = r.get("quiz_id")
-            qtot = int(quiz_totals.get(qid, 0))
-            rscore = r.get("score")
-            if qtot > 0 and isinstance(rscore, (int, float)):
-                got_sum += int(round(rscore))
-                tot_sum += qtot
-
-        avg = None
-        if tot_sum > 0:
-            avg = _pct((got_sum / float(tot_sum)) * 100)
-            class_got_sum += got_sum
-            class_tot_sum += tot_sum
-
-        last = None
-        if rlist:
-            last_row = sorted(rlist, key=lambda x: x.get("submitted_at") or "", reverse=True)[0]
-            qm = by_qid.get(last_row["quiz_id"], {})
-            last = {
-                "quiz": qm.get("title") or f"Quiz {qm.get('quiz_id')}",
-                "score": int(round(last_row.get("score") or 0)),   # raw obtained for that quiz
-                "total": int(quiz_totals.get(last_row["quiz_id"], 0)),  # actual quiz total
-                "date": last_row.get("submitted_at"),
-            }
+        for r in results:
+            _records_add(state, r.get("seat_no"), r.get("quiz_id"), r.get("score"), r.get("submitted_at"))
+    return state
+
+def _records_state(class_id: int) -> Dict[str, Any]:
+    state = _records_cache.get(class_id)
+    if state is not None:
+        return state
+    with _records_lock:
+        mark = (_records_epoch.get(class_id, 0), _records_epoch.get(None, 0))
+        quiet = not _records_pending.get(class_id) and not _records_pending.get(None)
+    state = _records_build(class_id)
+    with _records_lock:
+        # Only keep it if no write overlapped the build; otherwise that write's
+        # delta could be missing from (or doubled in) what we just read.
+        if quiet and mark == (_records_epoch.get(class_id, 0), _records_epoch.get(None, 0)) \
+                and not _records_pending.get(class_id) and not _records_pending.get(None):
+            _records_cache.set(class_id, state)
+    return state
+
+@contextmanager
+def _records_write(class_id: Optional[int]):
+    """
+    Brackets a DB write that affects class records (class_id None = any
+    class). Builds running meanwhile are not cached; apply the in-memory
+    change inside the block, after the DB write succeeded.
+    """
+    with _records_lock:
+        _records_epoch[class_id] = _records_epoch.get(class_id, 0) + 1
+        _records_pending[class_id] = _records_pending.get(class_id, 0) + 1
+    try:
+        yield
+    finally:
+        with _records_lock:
+            _records_pending[class_id] -= 1
 
-        fe.append({
-            "student_id": s.get("student_id"),
-            "id": seat,  # keep your existing id = seat so the UI doesn’t break
-            "name": s.get("full_name") or "Student",
-            "seat": seat,
-            "email": s.get("email"),
-            "average": avg,                          # percentage derived from real totals
-            "total_obtained": got_sum,               # expose aggregates for UI/CSV
-            "total_possible": tot_sum,
-            "totals": {"obtained": got_sum, "total": tot_sum},  # also expose nested for flexibility
-            "last": last,
-        })
+def _records_note_result(class_id, seat, quiz_id, score, submitted_at):
+    """
+    Applies an already-committed result to the cached class. Never raises: if
+    the update fails the class is dropped and rebuilt on the next read, so the
+    write's HTTP outcome can't depend on the cache.
+    """
+    if class_id is None:
+        return
+    try:
+        state = _records_cache.get(int(class_id))
+        if state is not None:
+            with _records_lock:
+                _records_add(state, seat, quiz_id, score, submitted_at)
+    except Exception as e:
+        print("[RECORDS] cache update failed, dropping class", class_id, ":", e)
+        try:
+            _records_invalidate(int(class_id))
+        except Exception:
+            _records_invalidate()
+
+def _records_rename_seat(old_seat: str, new_seat: str):
+    """results.seat_no is renamed globally, so every loaded class follows."""
+    old_key, new_key = _records_seat_key(old_seat), _records_seat_key(new_seat)
+    with _records_lock:
+        for _, state in _records_cache.items():
+            agg = state["seats"].pop(old_key, None)
+            if agg is None:
+                continue
+            cur = state["seats"].get(new_key)
+            if cur is None:
+                state["seats"][new_key] = agg
+                continue
+            cur["obtained"] += agg["obtained"]
+            cur["possible"] += agg["possible"]
+            if agg["last"] and (cur["last"] is None or (agg["last"]["date"] or "") >= (cur["last"]["date"] or "")):
+                cur["last"] = agg["last"]
+
+def _records_drop_seat(seat: str):
+    key = _records_seat_key(seat)
+    with _records_lock:
+        for _, state in _records_cache.items():
+            state["seats"].pop(key, None)
+
+def _records_invalidate(class_id: Optional[int] = None, quiz_id: Optional[int] = None):
+    """Forgets one class, every class holding `quiz_id`, or (no args) everything."""
+    with _records_lock:
+        if class_id is not None:
+            _records_epoch[class_id] = _records_epoch.get(class_id, 0) + 1
+            _records_cache.pop(int(class_id))
+            return
+        _records_epoch[None] = _records_epoch.get(None, 0) + 1
+        if quiz_id is None:
+            _records_cache.clear()
+            return
+        for cid, state in _records_cache.items():
+            if quiz_id in state["quizzes"]:
+                _records_cache.pop(cid)
+
+@app.post("/classes/{class_id}/records/rebuild")
+def rebuild_class_records(class_id: int):
+    """Recomputes a class's quiz totals and aggregates from the DB (repairs drift)."""
+    _, qids = _quiz_ids_for_class(class_id)
+    _refresh_quiz_totals(qids)  # replaces the cached (and stored) totals, not just the records
+    _records_invalidate(class_id)
+    state = _records_state(class_id)
+    return {"class_id": class_id, "quizzes": len(state["quizzes"]), "seats": len(state["seats"])}
+
+def _record_row(s: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+    seat = (s.get("seat_no") or "").upper()
+    agg = state["seats"].get(seat) or {}
+
+    # aggregate using actual totals
+    got_sum = int(agg.get("obtained", 0))
+    tot_sum = int(agg.get("possible", 0))
+
+    avg = None
+    if tot_sum > 0:
+        avg = _pct((got_sum / float(tot_sum)) * 100)
+
+    last = None
+    if agg.get("last"):
+        last_row = agg["last"]
+        qm = state["quizzes"].get(last_row["quiz_id"], {})
+        last = {
+            "quiz": qm.get("title") or f"Quiz {last_row['quiz_id']}",
+            "score": last_row["score"],             # raw obtained for that quiz
+            "total": int(qm.get("total", 0)),       # actual quiz total
+            "date": last_row["date"],
+        }
+
+    return {
+        "student_id": s.get("student_id"),
+        "id": seat,  # keep your existing id = seat so the UI doesn’t break
+        "name": s.get("full_name") or "Student",
+        "seat": seat,
+        "email": s.get("email"),
+        "average": avg,                          # percentage derived from real totals
+        "total_obtained": got_sum,               # expose aggregates for UI/CSV
+        "total_possible": tot_sum,
+        "totals": {"obtained": got_sum, "total": tot_sum},  # also expose nested for flexibility
+        "last": last,
+    }
 
+def _records_summary(fe: List[Dict[str, Any]], state: Dict[str, Any]) -> Dict[str, Any]:
+    class_got_sum = sum(x["total_obtained"] for x in fe if x["total_possible"] > 0)
+    class_tot_sum = sum(x["total_possible"] for x in fe if x["total_possible"] > 0)
     avg_class = _pct((class_got_sum / float(class_tot_sum)) * 100) if class_tot_sum > 0 else None
     top = None
     if fe:
@@ -677,12 +1846,58 @@ def class_records(class_id: int):
             top = {"id": ranked[0]["id"], "name": ranked[0]["name"], "seat": ranked[0]["seat"], "avg": ranked[0]["average"]}
 
     return {
-        "quizzesConducted": len(qids),
+        "quizzesConducted": len(state["quizzes"]),
         "avgClassScore": avg_class,
         "topPerformer": top,
-        "students": fe,
     }
 
+@app.get("/classes/{class_id}/records")
+def class_records(
+    class_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    """
+    Students newest-enrolled first. Without limit/cursor: everyone plus the
+    class summary, as before. Paged: {"students", "next"}, and the first page
+    (no cursor) also carries the class-wide summary fields. q = name/seat prefix.
+    """
+    paged = limit is not None or cursor is not None
+    limit = limit or (PAGE_DEFAULT if paged else None)
+    after = _decode_cursor(f"records:{class_id}", cursor, 2) if cursor else None
+
+    sq = (supabase.table("class_students")
+          .select("student_id, full_name, seat_no, email, enrolled_at")
+          .eq("class_id", class_id)
+          .order("enrolled_at", desc=True)
+          .order("student_id", desc=True))
+    sq = _apply_conds(sq, [
+        _keyset_cond("enrolled_at", "student_id", after) if after else None,
+        _prefix_cond(["full_name", "seat_no"], q),
+    ])
+    if limit:
+        sq = sq.limit(limit + 1)
+    studs, nxt = _page(sq.execute().data or [], limit, f"records:{class_id}",
+                       lambda r: [r.get("enrolled_at"), r["student_id"]])
+
+    state = _records_state(class_id)
+    fe = [_record_row(s, state) for s in studs]
+
+    if not paged:
+        return {**_records_summary(fe, state), "students": fe}
+    if cursor:
+        return {"students": fe, "next": nxt}
+
+    # summary is class-wide, so the first page reads every enrollment (seat/name only)
+    everyone = (supabase.table("class_students")
+                .select("student_id, full_name, seat_no")
+                .eq("class_id", class_id)
+                .order("enrolled_at", desc=True)
+                .order("student_id", desc=True)
+                .execute().data or [])
+    return {**_records_summary([_record_row(s, state) for s in everyone], state), "students": fe, "next": nxt}
+
 @app.get("/classes/{class_id}/student/{seat_no}/results")
 def student_results_by_seat(class_id: int, seat_no: str):
     seat = (seat_no or "").upper()
@@ -717,6 +1932,63 @@ def student_results_by_seat(class_id: int, seat_no: str):
 # =========================
 # Quizzes: list/get/create/delete
 # =========================
+# Assembled /quizzes/{id}/full payloads. Every write path that can change a
+# quiz's questions/options invalidates here; the TTL only covers edits made
+# directly in the database.
+_quiz_full_cache = TTLCache("quiz_full", QUIZ_CACHE_MAX, QUIZ_CACHE_TTL_SEC)
+_quiz_full_inflight: Dict[int, Future] = {}
+_quiz_full_lock = threading.Lock()
+_quiz_full_epoch = 0  # bumped on every invalidation; a fetch that straddles one is not cached
+
+def _invalidate_quiz_full(quiz_id: Optional[int] = None):
+    """Drops one quiz (or, with no id, every quiz) from the payload cache."""
+    global _quiz_full_epoch
+    with _quiz_full_lock:
+        _quiz_full_epoch += 1
+        if quiz_id is None:
+            _quiz_full_cache.clear()
+            _quiz_full_inflight.clear()
+        else:
+            _quiz_full_cache.pop(int(quiz_id))
+            _quiz_full_inflight.pop(int(quiz_id), None)
+
+def _quiz_full_cached(quiz_id: int) -> Dict[str, Any]:
+    """
+    Read-through: a hit is served from memory; concurrent misses for the same
+    quiz share a single fetch (the first caller runs it, the rest wait on its
+    Future), so an exam start costs one set of queries rather than one per
+    student. Errors such as the 404 reach every waiter and are not cached.
+    """
+    cached = _quiz_full_cache.get(quiz_id)
+    if cached is not None:
+        return cached
+
+    with _quiz_full_lock:
+        fut = _quiz_full_inflight.get(quiz_id)
+        leader = fut is None
+        if leader:
+            fut = Future()
+            _quiz_full_inflight[quiz_id] = fut
+            epoch = _quiz_full_epoch
+    if not leader:
+        _quiz_full_cache.coalesced += 1
+        return fut.result()
+
+    try:
+        payload = _fetch_quiz_full(quiz_id)
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _quiz_full_lock:
+            if _quiz_full_inflight.get(quiz_id) is fut:
+                del _quiz_full_inflight[quiz_id]
+            fresh = epoch == _quiz_full_epoch
+    if fresh:
+        _quiz_full_cache.set(quiz_id, payload)
+    fut.set_result(payload)
+    return payload
+
 def _normalize_question(raw, i=0):
     qtype = (raw.get("type") or "short").lower()
     prompt = str(raw.get("prompt") or raw.get("q") or "").strip() or f"Question {i+1}"
@@ -729,54 +2001,133 @@ def _normalize_question(raw, i=0):
     }
     return out
 
-def _insert_question_with_options(quiz_id: int, q: Dict[str, Any]) -> int:
+def _question_and_option_rows(q: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
     q_row = {
-        "quiz_id": quiz_id,
         "question_text": q["question_text"],
         "question_type": q["question_type"],
         "correct_answer": q.get("correct_answer")
     }
-    r = supabase.table("questions").insert(q_row).execute()
-    question_id = r.data[0]["question_id"]
 
+    opt_rows = []
     choices = q.get("choices") or []
     if isinstance(choices, list) and choices:
-        opt_rows = []
         correct_idx = q.get("answer_index")
         for idx, text in enumerate(choices):
             opt_rows.append({
-                "question_id": question_id,
                 "option_text": str(text),
                 "is_correct": (idx == correct_idx)
             })
-        supabase.table("question_options").insert(opt_rows).execute()
+    return q_row, opt_rows
 
-    return question_id
+def _delete_quiz_cascade(quiz_id: int):
+    qs = supabase.table("questions").select("question_id").eq("quiz_id", quiz_id).execute().data
+    qids = [q["question_id"] for q in qs] or [-1]
+    supabase.table("question_options").delete().in_("question_id", qids).execute()
+    supabase.table("questions").delete().eq("quiz_id", quiz_id).execute()
+    supabase.table("quizzes").delete().eq("quiz_id", quiz_id).execute()
+    _invalidate_quiz_full(quiz_id)
+    _forget_quiz_totals(quiz_id)
+    _records_invalidate(quiz_id=quiz_id)
+
+def _create_quiz_with_questions(quiz_row: Dict[str, Any], items: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]) -> int:
+    """
+    Inserts the quiz, then ALL its questions in one request and ALL their
+    options in one more, whatever the question count. PostgREST has no
+    transaction across requests, so a failure after the quiz row exists
+    removes whatever was written rather than leaving a half-built quiz.
+    """
+    marks = _quiz_marks([row.get("question_type") for row, _ in items])
+    if QUIZ_TOTALS_COLUMNS:
+        quiz_row = {**quiz_row, "total_marks": marks["total"], "marks_breakdown": marks["breakdown"]}
+    class_id = quiz_row.get("class_id")
+    # records built while the quiz is half-written would cache it with total 0,
+    # so keep them out of the cache until questions and options are in
+    with _records_write(class_id):
+        quiz_id = supabase.table("quizzes").insert(quiz_row).execute().data[0]["quiz_id"]
+        try:
+            if items:
+                q_rows = [{**row, "quiz_id": quiz_id} for row, _ in items]
+                inserted = supabase.table("questions").insert(q_rows).execute().data or []
+                if len(inserted) != len(q_rows):
+                    raise RuntimeError(f"inserted {len(inserted)} of {len(q_rows)} questions")
+                # ids come from the sequence in VALUES order, so id order == input order
+                qids = sorted(int(r["question_id"]) for r in inserted)
+
+                opt_rows = [{**o, "question_id": qid} for qid, (_, opts) in zip(qids, items) for o in opts]
+                if opt_rows:
+                    supabase.table("question_options").insert(opt_rows).execute()
+            _remember_quiz_totals(quiz_id, marks)
+        except Exception:
+            try:
+                _delete_quiz_cascade(quiz_id)
+            except Exception as cleanup_err:
+                print("[QUIZ] cleanup after failed create also failed:", quiz_id, cleanup_err)
+            raise
+        finally:
+            _invalidate_quiz_full(quiz_id)
+            if class_id is not None:
+                _records_invalidate(class_id)
+    return quiz_id
 
 @app.get("/quizzes")
-def list_quizzes(class_id: Optional[int] = None, with_counts: bool = True):
-    q = supabase.table("quizzes").select("*").order("created_at", desc=True)
-    if class_id is not None:
-        q = q.eq("class_id", class_id)
-    r = q.execute()
-    rows = r.data or []
-    if not with_counts or not rows:
-        return {"rows": rows}
-
-    ids = [row["quiz_id"] for row in rows]
-    q_rows = supabase.table("questions").select("quiz_id").in_("quiz_id", ids).execute().data or []
-    q_count = Counter([x["quiz_id"] for x in q_rows])
-
-    r_rows = supabase.table("results").select("quiz_id").in_("quiz_id", ids).execute().data or []
-    r_count = Counter([x["quiz_id"] for x in r_rows])
+def list_quizzes(
+    class_id: Optional[int] = None,
+    with_counts: bool = True,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    """
+    Newest first. Without limit/cursor returns every match as {"rows"}; with
+    them, one page plus "next" (pass it back as cursor; null on the last page).
+    Filters: class_id, created_from/created_to (ISO, inclusive), q = title prefix.
+    """
+    paged = limit is not None or cursor is not None
+    limit = limit or (PAGE_DEFAULT if paged else None)
+    after = _decode_cursor("quizzes", cursor, 2) if cursor else None
+
+    def build(cols):
+        qb = supabase.table("quizzes").select(cols).order("created_at", desc=True).order("quiz_id", desc=True)
+        if class_id is not None:
+            qb = qb.eq("class_id", class_id)
+        if created_from:
+            qb = qb.gte("created_at", created_from)
+        if created_to:
+            qb = qb.lte("created_at", created_to)
+        qb = _apply_conds(qb, [
+            _keyset_cond("created_at", "quiz_id", after) if after else None,
+            _prefix_cond(["title"], q),
+        ])
+        return qb.limit(limit + 1) if limit else qb
+
+    def reply(rows, nxt):
+        return {"rows": rows, "next": nxt} if paged else {"rows": rows}
+
+    if not with_counts:
+        return reply(*_page(build("*").execute().data or [], limit, "quizzes",
+                            lambda r: [r.get("created_at"), r["quiz_id"]]))
+    rows, counts = _select_with_counts(build, ["questions", "results"])
+    rows, nxt = _page(rows, limit, "quizzes", lambda r: [r.get("created_at"), r["quiz_id"]])
+    if not rows:
+        return reply(rows, nxt)
+
+    if counts is None:
+        ids = [row["quiz_id"] for row in rows]
+        q_count = _counts_by("questions", "quiz_id", ids)
+        r_count = _counts_by("results", "quiz_id", ids)
+        counts = {
+            "questions": {i: q_count.get(row["quiz_id"], 0) for i, row in enumerate(rows)},
+            "results": {i: r_count.get(row["quiz_id"], 0) for i, row in enumerate(rows)},
+        }
 
     out = []
-    for row in rows:
-        qid = row["quiz_id"]
-        row["question_count"] = int(q_count.get(qid, 0))
-        row["result_count"]   = int(r_count.get(qid, 0))
+    for i, row in enumerate(rows):
+        row["question_count"] = int(counts["questions"][i])
+        row["result_count"]   = int(counts["results"][i])
         out.append(row)
-    return {"rows": out}
+    return reply(out, nxt)
 
 @app.post("/quizzes")
 def create_quiz(payload: Dict[str, Any]):
@@ -786,18 +2137,17 @@ def create_quiz(payload: Dict[str, Any]):
         qtype = (payload.get("type") or "mixed").lower()
         duration = int(payload.get("duration_min") or 20)
 
-        r = supabase.table("quizzes").insert({
+        items = [
+            _question_and_option_rows(_normalize_question(raw, i))
+            for i, raw in enumerate(payload.get("questions") or [])
+        ]
+        quiz_id = _create_quiz_with_questions({
             "class_id": class_id,
             "title": title,
             "type": qtype,
             "duration_min": duration,
             "created_at": now_iso(),
-        }).execute()
-        quiz_id = r.data[0]["quiz_id"]
-
-        for i, raw in enumerate(payload.get("questions") or []):
-            qnorm = _normalize_question(raw, i)
-            _insert_question_with_options(quiz_id, qnorm)
+        }, items)
 
         return {"quiz_id": quiz_id}
     except Exception as e:
@@ -806,6 +2156,9 @@ def create_quiz(payload: Dict[str, Any]):
 
 @app.get("/quizzes/{quiz_id}/full")
 def get_quiz_full(quiz_id: int):
+    return _quiz_full_cached(quiz_id)
+
+def _fetch_quiz_full(quiz_id: int) -> Dict[str, Any]:
     # Fetch quiz row
     qr = (
         supabase.table("quizzes")
@@ -901,11 +2254,7 @@ def get_quiz_full(quiz_id: int):
 @app.delete("/quizzes/{quiz_id}")
 def delete_quiz(quiz_id: int):
     try:
-        qs = supabase.table("questions").select("question_id").eq("quiz_id", quiz_id).execute().data
-        qids = [q["question_id"] for q in qs] or [-1]
-        supabase.table("question_options").delete().in_("question_id", qids).execute()
-        supabase.table("questions").delete().eq("quiz_id", quiz_id).execute()
-        supabase.table("quizzes").delete().eq("quiz_id", quiz_id).execute()
+        _delete_quiz_cascade(quiz_id)
         return JSONResponse(status_code=204, content={})
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Delete failed: {e}")
@@ -925,12 +2274,151 @@ def submit_result(payload: Dict[str, Any]):
             "answers_json": payload.get("answers_json"),
             "submitted_at": now_iso(),
         }
-        r = supabase.table("results").insert(data).execute()
+        with _records_write(data["class_id"]):
+            r = supabase.table("results").insert(data).execute()
+            _records_note_result(data["class_id"], data["seat_no"], data["quiz_id"], data["score"], data["submitted_at"])
         return {"inserted": r.data}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Submit failed: {e}")
 
 # ===================== Submit quiz (MCQ via option_id, short via AI) =====================
+async def _grade_short_answer(question_text: str, answer: str, max_marks: int) -> Tuple[int, Optional[str]]:
+    """
+    One AI grading call under the process-wide limit. Failures score 0 and are
+    reported back instead of raising, so one slow/bad call can't sink the
+    whole submission.
+    """
+    try:
+        async with _ai_grading_sem():
+            ai = await asyncio.wait_for(
+                call_ai_evaluate(question_text, answer, max_marks=max_marks),
+                timeout=AI_GRADE_TIMEOUT_SEC,
+            )
+        return int(ai.get("score") or 0), None
+    except asyncio.TimeoutError:
+        print("[GRADE] timed out after", AI_GRADE_TIMEOUT_SEC, "s")
+        return 0, "timeout"
+    except Exception as e:
+        print("[GRADE] failed:", e)
+        return 0, "failed"
+
+async def _grade_batch_chunk(chunk: List[Dict[str, Any]], max_marks: int) -> Dict[str, int]:
+    try:
+        async with _ai_grading_sem():
+            scores = await asyncio.wait_for(
+                call_ai_evaluate_batch(chunk, max_marks=max_marks),
+                timeout=AI_BATCH_TIMEOUT_SEC,
+            )
+    except Exception as e:
+        print("[GRADE] batch failed, falling back per question:", e)
+        return {}
+    try:
+        for it in chunk:
+            score = scores.get(str(it["question_id"]))
+            if score is not None:
+                await _grade_remember(_grade_key(it["question"], it["answer"], max_marks), score)
+    except Exception as e:  # caching is best-effort; the scores above still stand
+        print("[GRADE] could not cache batch scores:", e)
+    return scores
+
+async def _grade_short_answers(jobs: List[Tuple[int, str, str]], max_marks: int) -> List[Tuple[int, Optional[str]]]:
+    """
+    Grades (question_id, question_text, answer) jobs, results aligned with
+    `jobs`. Cache hits are served first; the rest go to Gemini in as few batch
+    prompts as possible, and only entries the batch couldn't score fall back
+    to one call_ai_evaluate each.
+    """
+    results: List[Optional[Tuple[int, Optional[str]]]] = [None] * len(jobs)
+    pending: List[int] = []
+    for i, (_, q, a) in enumerate(jobs):
+        hit = await _grade_cached(_grade_key((q or "").strip().lower(), (a or "").strip().lower(), max_marks))
+        if hit is not None:
+            results[i] = (hit, None)
+        else:
+            pending.append(i)
+
+    if AI_BATCH_GRADING and len(pending) > 1:
+        batchable, seen = [], set()
+        for i in pending:
+            qid = str(jobs[i][0])
+            if qid not in seen:  # question_id is the batch key, so keep it unique
+                seen.add(qid)
+                batchable.append(i)
+        chunks = [batchable[k:k + AI_BATCH_MAX_ITEMS] for k in range(0, len(batchable), AI_BATCH_MAX_ITEMS)]
+        chunk_scores = await asyncio.gather(*(
+            _grade_batch_chunk(
+                [{"question_id": jobs[i][0], "question": jobs[i][1], "answer": jobs[i][2]} for i in chunk],
+                max_marks,
+            )
+            for chunk in chunks
+        ))
+        for chunk, scores in zip(chunks, chunk_scores):
+            for i in chunk:
+                score = scores.get(str(jobs[i][0]))
+                if score is not None:
+                    results[i] = (score, None)
+
+    leftovers = [i for i in pending if results[i] is None]
+    graded = await asyncio.gather(*(_grade_short_answer(jobs[i][1], jobs[i][2], max_marks) for i in leftovers))
+    for i, res in zip(leftovers, graded):
+        results[i] = res
+    return results
+
+_PREGRADE_STOPWORDS = {"a", "an", "the", "of", "is", "are", "was", "were", "it", "its", "to", "in"}
+
+def _pregrade_norm(t: str) -> str:
+    t = (t or "").strip().lower()
+    t = re.sub(r"(?<=\d),(?=\d{3}\b)", "", t)  # 1,000 -> 1000
+    t = re.sub(r"[^\w\s./-]", " ", t)  # drop punctuation...
+    t = re.sub(r"(?<=[\w.])-|-(?!\.?\d)", " ", t)  # ...but keep a leading minus sign
+    t = re.sub(r"(?<!\d)/|/(?!\d)", " ", t)  # ...fraction slashes
+    t = re.sub(r"(?<![\d-])\.|\.(?!\d)", " ", t)  # ...and decimal points
+    return re.sub(r"\s+", " ", t).strip()
+
+def _as_number(t: str) -> Optional[float]:
+    try:
+        if t.count("/") == 1:
+            num, den = t.split("/")
+            return float(num) / float(den)
+        return float(t)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+def _pregrade_short(answer: Optional[str], correct_answer: Optional[str], max_marks: int) -> Optional[int]:
+    """
+    Deterministic scoring ahead of the AI: blank -> 0, a match with the stored
+    correct_answer -> full marks. Returns None for everything in between,
+    which still goes to Gemini.
+    """
+    got = _pregrade_norm(answer)
+    if not got:
+        return 0
+    want = _pregrade_norm(correct_answer)
+    if not want:
+        return None
+    if got == want:
+        return max_marks
+
+    got_num, want_num = _as_number(got), _as_number(want)
+    if got_num is not None and want_num is not None:
+        return max_marks if abs(got_num - want_num) < 1e-9 else None
+
+    # word order matters ("sun orbits earth" != "earth orbits sun"), so compare
+    # the token sequences rather than token sets
+    got_tokens = [w for w in got.split() if w not in _PREGRADE_STOPWORDS]
+    want_tokens = [w for w in want.split() if w not in _PREGRADE_STOPWORDS]
+    if got_tokens and want_tokens:
+        similarity = difflib.SequenceMatcher(None, got_tokens, want_tokens, autojunk=False).ratio()
+        if similarity >= PREGRADE_TOKEN_THRESHOLD:
+            return max_marks
+    return None
+
+def _mcq_option_id(answer: Optional[str]) -> int:
+    try:
+        return int((answer or "-1").strip())
+    except Exception:
+        return -1
+
 class CheckQuizRequest(BaseModel):
     quiz_id: int              
     seat_no: str
@@ -942,63 +2430,80 @@ class CheckQuizRequest(BaseModel):
 @app.post("/submit_quiz", status_code=200)
 async def submit_quiz(req: CheckQuizRequest):
     detailed_results: list[dict] = []
-    total_score = 0
+    short_jobs: list[tuple] = []   # (index into detailed_results, question_id, question_text, answer)
 
     if not req.answers or len(req.answers) == 0:
-        qs_all = (supabase.table("questions")
+        qs_all = (await adb(supabase.table("questions")
                   .select("question_id")
                   .eq("quiz_id", req.quiz_id)
-                  .order("question_id")
-                  .execute().data or [])
+                  .order("question_id"))).data or []
         req.answers = [
             SubmitAnswer(question_id=int(q["question_id"]), answer="")  # blank (0 marks)
 
             for q in qs_all
         ]
 
+    # one round trip for every answered question...
+    answered_ids = list({int(ans.question_id) for ans in req.answers})
+    q_rows = (await adb(supabase.table("questions")
+              .select("question_id, question_type, question_text, correct_answer")
+              .in_("question_id", answered_ids or [-1]))).data or []
+    questions_by_id = {int(q["question_id"]): q for q in q_rows}
+
+    # ...and one for every option picked in an MCQ (each answer is still
+    # scored by its own option below, even if a question is answered twice)
+    opt_ids = set()
+    for ans in req.answers:
+        qrow = questions_by_id.get(int(ans.question_id))
+        if qrow and (qrow.get("question_type") or "").strip().lower() == "mcq":
+            opt_ids.add(_mcq_option_id(ans.answer))
+    opt_ids = [oid for oid in opt_ids if oid > 0]
+    correct_by_opt: Dict[int, bool] = {}
+    if opt_ids:
+        o_rows = (await adb(supabase.table("question_options")
+                  .select("option_id, is_correct")
+                  .in_("option_id", opt_ids))).data or []
+        correct_by_opt = {int(o["option_id"]): bool(o.get("is_correct")) for o in o_rows}
+
     for ans in req.answers:
         qid = int(ans.question_id)  # guaranteed valid by Pydantic
 
-        # fetch the question row
-        qr = (supabase.table("questions")
-              .select("question_type, question_text")
-              .eq("question_id", qid)
-              .limit(1).execute())
-        if not qr.data:
+        qrow = questions_by_id.get(qid)
+        if not qrow:
             # skip or raise; skipping is gentler for late-added/removed questions
             continue
 
-        qrow = qr.data[0]
         qtype = (qrow.get("question_type") or "").strip().lower()
 
         score = 0
         if qtype == "mcq":
             # MCQ carries option_id in ans.answer
-            try:
-                opt_id = int((ans.answer or "-1").strip())
-            except Exception:
-                opt_id = -1
-
-            if opt_id > 0:
-                orow = (supabase.table("question_options")
-                        .select("is_correct")
-                        .eq("option_id", opt_id)
-                        .limit(1).execute()).data
-                score = 1 if (orow and orow[0]["is_correct"]) else 0
+            score = 1 if correct_by_opt.get(_mcq_option_id(ans.answer), False) else 0
         else:
-            # short/free-response → AI score 0..3
-            ai = await call_ai_evaluate(qrow.get("question_text") or "", ans.answer or "", max_marks=3)
-            score = int(ai.get("score") or 0)
+            # short/free-response → blank/exact matches scored locally, the rest
+            # by AI 0..3 (graded concurrently below)
+            local = _pregrade_short(ans.answer, qrow.get("correct_answer"), 3)
+            if local is not None:
+                score = local
+            else:
+                short_jobs.append((len(detailed_results), qid, qrow.get("question_text") or "", ans.answer or ""))
 
-        total_score += score
         detailed_results.append({
             "question_id": qid,
             "submitted_answer": ans.answer,
             "score": score
         })
 
+    graded = await _grade_short_answers([job[1:] for job in short_jobs], max_marks=3)
+    for (idx, *_), (score, error) in zip(short_jobs, graded):
+        detailed_results[idx]["score"] = score
+        if error:
+            detailed_results[idx]["grading_error"] = error
+
+    total_score = sum(int(d["score"]) for d in detailed_results)
+
     # insert result (see #2 for answers_json)
-    (supabase.table("results").insert({
+    row = {
         "quiz_id": int(req.quiz_id),     # store as bigint
         "class_id": int(req.class_id),
         "seat_no": (req.seat_no or None),
@@ -1006,7 +2511,10 @@ async def submit_quiz(req: CheckQuizRequest):
         "score": total_score,
         "answers_json": detailed_results,  # <-- JSONB properly (not string)
         "submitted_at": now_iso()
-    }).execute())
+    }
+    with _records_write(row["class_id"]):
+        await adb(supabase.table("results").insert(row))
+        _records_note_result(row["class_id"], row["seat_no"], row["quiz_id"], total_score, row["submitted_at"])
 
     return {
         "quiz_id": int(req.quiz_id),
@@ -1064,10 +2572,12 @@ def update_student(student_id: str, patch: StudentPatch, user: AuthedUser = Depe
 
     # 5) cascade to results so historical reports stay tied to the new seat
     if old_seat and new_seat and new_seat != old_seat:
-        supabase.table("results").update({
-            "seat_no": new_seat,
-            "email": new_email
-        }).eq("seat_no", old_seat).execute()
+        with _records_write(None):
+            supabase.table("results").update({
+                "seat_no": new_seat,
+                "email": new_email
+            }).eq("seat_no", old_seat).execute()
+            _records_rename_seat(old_seat, new_seat)
 
     return {"ok": True, "student_id": student_id, "updated": {
         "seat_no": new_seat, "full_name": new_name, "email": new_email
@@ -1131,10 +2641,12 @@ def patch_student_by_seat(class_id: int, seat_no: str, body: StudentPatch):
 
     # 5) cascade to results so historical reports stay tied to the new seat (global)
     if old_seat and new_seat and new_seat != old_seat:
-        supabase.table("results").update({
-            "seat_no": new_seat,
-            "email": new_email
-        }).eq("seat_no", old_seat).execute()
+        with _records_write(None):
+            supabase.table("results").update({
+                "seat_no": new_seat,
+                "email": new_email
+            }).eq("seat_no", old_seat).execute()
+            _records_rename_seat(old_seat, new_seat)
 
     return {"ok": True, "student_id": student_id, "updated": {
         "seat_no": new_seat, "full_name": new_name, "email": new_email
@@ -1179,7 +2691,9 @@ def delete_student_from_class(class_id: int, seat_no: str):
 
         # Otherwise: fully remove student (only belonged to this class)
         # 1) delete results for this (globally-unique) seat
-        supabase.table("results").delete().eq("seat_no", seat).execute()
+        with _records_write(None):
+            supabase.table("results").delete().eq("seat_no", seat).execute()
+            _records_drop_seat(seat)
 
         # 2) remove any leftover enrollments (safety)
         supabase.table("class_students").delete().eq("student_id", student_id).execute()
@@ -1194,6 +2708,58 @@ def delete_student_from_class(class_id: int, seat_no: str):
 # =========================
 # Generator (topic/pdf/image) with hardened OCR & preview flag
 # =========================
+_preview_store = TTLCache("quiz_previews", PREVIEW_STORE_MAX, PREVIEW_TTL_SEC)
+
+# Same content + count + format -> same generated set, until GEN_CACHE_TTL_SEC
+# passes or the caller sends fresh=1 (e.g. the teacher hits Generate again).
+_generation_cache = TTLCache("generated_questions", GEN_CACHE_MAX, GEN_CACHE_TTL_SEC)
+
+def _generation_key(content: str, n_questions: int, format: str) -> str:
+    norm = re.sub(r"\s+", " ", (content or "").lower()).strip(" .?!")
+    raw = json.dumps([hashlib.sha256(norm.encode("utf-8")).hexdigest(), int(n_questions), (format or "").lower()])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class CommitPreviewRequest(BaseModel):
+    preview_token: str
+    title: Optional[str] = None
+    questions: Optional[List[Dict[str, Any]]] = None  # teacher edits, same shape as the preview
+
+async def _persist_generated_quiz(class_id: int, title: str, format: str, questions: List[Dict[str, Any]]) -> int:
+    existing = await adb(supabase.table("quizzes").select("*").eq("title", title).eq("class_id", class_id))
+    if existing.data:
+        raise HTTPException(status_code=400, detail="Quiz with this title already exists for the class")
+
+    quiz_payload = {"class_id": class_id, "title": title, "type": format, "duration_min": 10, "created_at": now_iso()}
+
+    type_mapping = {"short": "short_answer", "mcq": "mcq", "true_false": "true_false"}
+    items = []
+    for q in questions:
+        q_type_token = normalize_q_type(q.get("type"))
+        q_type = type_mapping.get(q_type_token, "short_answer")
+        if format == "short":
+            q_type = "short_answer"
+
+        q_row = {
+            "question_text": q.get("text") or q.get("prompt") or "",
+            "question_type": q_type,
+            "correct_answer": q.get("correct_answer", None)
+        }
+
+        rows = []
+        opts = q.get("options") or q.get("choices") or []
+        if opts and q_type == "mcq":
+            correct = str(q.get("correct_answer", "")).strip().lower()
+            for i, o in enumerate(opts):
+                txt = str(o.get("text", "")).strip() if isinstance(o, dict) else str(o).strip()
+                rows.append({
+                    "option_text": txt,
+                    "is_correct": (txt.lower() == correct)
+                })
+        items.append((q_row, rows))
+
+    quiz_id = await adb_run(_create_quiz_with_questions, quiz_payload, items)
+    return quiz_id
+
 @app.post("/generate_quiz", status_code=201)
 async def generate_quiz(
     request: Request,
@@ -1203,34 +2769,26 @@ async def generate_quiz(
     format: str = Form(...),  # "mcq" | "short" | "mixed"
     pdf: UploadFile = File(None),
     image: UploadFile = File(None),
-    preview: Optional[int] = Form(None)
+    preview: Optional[int] = Form(None),
+    fresh: Optional[int] = Form(None)
 ):
     try:
         _setup_tesseract_cmd()
 
         preview_q = request.query_params.get("preview")
         preview_flag = ((str(preview).strip() == "1") if preview is not None else (str(preview_q or "0").strip() == "1"))
+        fresh_q = request.query_params.get("fresh")
+        fresh_flag = ((str(fresh).strip() == "1") if fresh is not None else (str(fresh_q or "0").strip() == "1"))
 
         content_text = ""
 
+        # pdfplumber/OCR are CPU-bound and synchronous: keep them off the event loop
         if pdf is not None:
             contents = await pdf.read()
-            with pdfplumber.open(BytesIO(contents)) as pdf_file:
-                for page in pdf_file.pages:
-                    t = page.extract_text()
-                    if t:
-                        content_text += t + "\n"
-            if not content_text.strip():
-                images = convert_from_bytes(contents, dpi=300)
-                for pil_img in images:
-                    buf = BytesIO()
-                    pil_img.save(buf, format="PNG")
-                    txt = _ocr_image_bytes(buf.getvalue())
-                    if txt:
-                        content_text += txt + "\n"
+            content_text = await asyncio.to_thread(_extract_upload_text, "pdf", contents)
         elif image is not None:
             raw = await image.read()
-            content_text = _ocr_image_bytes(raw)
+            content_text = await asyncio.to_thread(_extract_upload_text, "image", raw)
 
         if (not content_text or not content_text.strip()) and (topic and topic.strip()):
             content_text = topic.strip()
@@ -1247,69 +2805,41 @@ async def generate_quiz(
             if len(re.findall(r"[A-Za-z0-9]", cleaned)) < 10 and not (topic and topic.strip()):
                 raise HTTPException(status_code=422, detail="No readable text found in the PDF. Try a text-based PDF or provide a topic.")
 
-        CHUNK_SIZE = 800
-        if (pdf or image) and len(cleaned) > CHUNK_SIZE:
-            questions = []
-            chunks = [cleaned[i:i+CHUNK_SIZE] for i in range(0, len(cleaned), CHUNK_SIZE)]
-            remaining = int(n_questions)
-            for chunk in chunks:
-                if remaining <= 0:
-                    break
-                qs = call_ai_generate(pdf_text=chunk, n_questions=remaining, format_type=format)
-                questions.extend(qs)
-                remaining = int(n_questions) - len(questions)
-            questions = questions[: int(n_questions)]
+        gen_key = _generation_key(cleaned, int(n_questions), format)
+        cached = None if fresh_flag else _generation_cache.get(gen_key)
+        if cached is not None:
+            questions = copy.deepcopy(cached)
         else:
-            questions = call_ai_generate(pdf_text=cleaned, n_questions=int(n_questions), format_type=format)
+            CHUNK_SIZE = 800
+            if (pdf or image) and len(cleaned) > CHUNK_SIZE:
+                chunks = [cleaned[i:i+CHUNK_SIZE] for i in range(0, len(cleaned), CHUNK_SIZE)]
+                questions = await generate_from_chunks(chunks, int(n_questions), format)
+            else:
+                questions = await call_ai_generate(pdf_text=cleaned, n_questions=int(n_questions), format_type=format)
+            if questions:
+                _generation_cache.set(gen_key, copy.deepcopy(questions))
 
         debug_flag = (request.query_params.get("debug") == "1") or (str(request.headers.get("x-debug", "0")) == "1")
         if preview_flag:
+            # keep exactly what the teacher is shown, so committing it costs no AI call
+            preview_token = secrets.token_urlsafe(16)
+            _preview_store.set(preview_token, {
+                "class_id": class_id,
+                "title": (topic or ("PDF/Image Quiz")),
+                "format": format,
+                "questions": questions,
+            })
             resp = {
                 "title": (topic or ("PDF" if pdf else "Image") or "Generated Quiz"),
-                "questions": questions
+                "questions": questions,
+                "preview_token": preview_token,
+                "preview_expires_in": PREVIEW_TTL_SEC,
             }
             if debug_flag:
                 resp["_debug_ocr_preview"] = (cleaned or "")[:300]
             return resp
 
-        title = (topic or ("PDF/Image Quiz"))
-        existing = supabase.table("quizzes").select("*").eq("title", title).eq("class_id", class_id).execute()
-        if existing.data:
-            raise HTTPException(status_code=400, detail="Quiz with this title already exists for the class")
-
-        quiz_payload = {"class_id": class_id, "title": title, "type": format, "duration_min": 10, "created_at": now_iso()}
-        r = supabase.table("quizzes").insert(quiz_payload).execute()
-        quiz_id = r.data[0]["quiz_id"]
-
-        type_mapping = {"short": "short_answer", "mcq": "mcq", "true_false": "true_false"}
-        for q in questions:
-            q_type_token = normalize_q_type(q.get("type"))
-            q_type = type_mapping.get(q_type_token, "short_answer")
-            if format == "short":
-                q_type = "short_answer"
-
-            q_row = {
-                "quiz_id": quiz_id,
-                "question_text": q.get("text") or q.get("prompt") or "",
-                "question_type": q_type,
-                "correct_answer": q.get("correct_answer", None)
-            }
-            ir = supabase.table("questions").insert(q_row).execute()
-            qid = ir.data[0]["question_id"]
-
-            opts = q.get("options") or q.get("choices") or []
-            if opts and q_type == "mcq":
-                correct = str(q.get("correct_answer", "")).strip().lower()
-                rows = []
-                for i, o in enumerate(opts):
-                    txt = str(o.get("text", "")).strip() if isinstance(o, dict) else str(o).strip()
-                    rows.append({
-                        "question_id": qid,
-                        "option_text": txt,
-                        "is_correct": (txt.lower() == correct)
-                    })
-                supabase.table("question_options").insert(rows).execute()
-
+        quiz_id = await _persist_generated_quiz(class_id, (topic or ("PDF/Image Quiz")), format, questions)
         return {"status": "success", "quiz_id": quiz_id}
 
     except HTTPException:
@@ -1318,13 +2848,226 @@ async def generate_quiz(
         msg = str(e).lower()
         if "tesseract is not installed" in msg:
             raise HTTPException(status_code=500, detail="Tesseract not found. Set TESSERACT_CMD or add to PATH.")
-        if "poppler" in msg or "convert_from_bytes" in msg:
+        if "poppler" in msg or "convert_from_path" in msg:
             raise HTTPException(status_code=500, detail="Poppler is required for PDF OCR. Install it and retry.")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate_quiz/commit", status_code=201)
+async def commit_generated_quiz(body: CommitPreviewRequest):
+    """Persists a previewed quiz (optionally with the teacher's edits) without regenerating it."""
+    preview = _preview_store.pop(body.preview_token)  # claim it: single use, even under double-clicks
+    if preview is None:
+        raise HTTPException(status_code=404, detail="Preview expired or not found. Generate the quiz again.")
+
+    questions = body.questions if body.questions is not None else preview["questions"]
+    title = (body.title or "").strip() or preview["title"]
+
+    try:
+        if not questions:
+            raise HTTPException(status_code=422, detail="No questions to save")
+        quiz_id = await _persist_generated_quiz(preview["class_id"], title, preview["format"], questions)
+    except Exception as e:
+        _preview_store.set(body.preview_token, preview)  # let the teacher fix it and retry
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", "quiz_id": quiz_id}
+
+# =========================
+# Exports (streamed: one page of rows in memory at a time)
+# =========================
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+def _export_lines(fmt: str, columns: List[Tuple[str, str]], rows):
+    """
+    CSV (header of column labels first, BOM so Excel reads UTF-8) or NDJSON
+    (rows as they are, keyed by column key), one chunk per row.
+    """
+    if fmt == "ndjson":
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+        return
+    buf = StringIO()
+    writer = csv.writer(buf)
+
+    def line(values):
+        writer.writerow(values)
+        out = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return out
+
+    yield "\ufeff" + line([label for _, label in columns])
+    for row in rows:
+        yield line(["" if row.get(key) is None else row.get(key) for key, _ in columns])
+
+def _export_response(fmt: str, filename: str, columns: List[Tuple[str, str]], rows) -> StreamingResponse:
+    return StreamingResponse(
+        _export_lines(fmt, columns, rows),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+def _seat_match_cond(seats) -> Optional[str]:
+    # results.seat_no is stored as typed at submit time and records compare
+    # upper-cased, so match case-insensitively and key the rows on .upper()
+    wanted = sorted({s.strip().replace("*", "") for s in seats if s and s.strip()})
+    if not wanted:
+        return None
+    return ",".join(f"seat_no.ilike.{_pgrst_value(_like_literal(s))}" for s in wanted)
+
+def _iter_pages(build, sort_col: str, pk_col: str):
+    """Pages a (sort_col desc, pk_col desc) query EXPORT_PAGE_SIZE rows at a time, keyset-style."""
+    after = None
+    while True:
+        q = build().order(sort_col, desc=True).order(pk_col, desc=True)
+        q = _apply_conds(q, [_keyset_cond(sort_col, pk_col, after) if after else None])
+        rows = q.limit(EXPORT_PAGE_SIZE).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < EXPORT_PAGE_SIZE:
+            return
+        after = [rows[-1].get(sort_col), rows[-1][pk_col]]
+
+def _check_export_format(format: str) -> str:
+    fmt = (format or "").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    return fmt
+
+@app.get("/classes/{class_id}/records/export")
+def export_class_records(class_id: int, format: str = "csv", layout: str = "summary"):
+    """
+    Gradebook for every enrolled student, same numbers as /records.
+    layout=summary adds the last submission; layout=per_quiz adds one column
+    per quiz (latest score of each, blank if not taken; NDJSON key quiz_<id>).
+    """
+    fmt = _check_export_format(format)
+    if layout not in ("summary", "per_quiz"):
+        raise HTTPException(status_code=400, detail="layout must be summary or per_quiz")
+
+    state = _records_state(class_id)
+    quizzes = state["quizzes"]  # created_at order
+    header = ["seat", "name", "email", "total_obtained", "total_possible", "average"]
+    if layout == "summary":
+        header += ["last_quiz", "last_score", "last_total", "last_date"]
+    columns = [(h, h) for h in header]
+    if layout == "per_quiz":
+        # cells keyed by quiz id (titles may repeat); the title is only the CSV label
+        quiz_cols = {qid: f"quiz_{qid}" for qid in quizzes}
+        columns += [(quiz_cols[qid], f"{q.get('title') or f'Quiz {qid}'} (/{q['total']})") for qid, q in quizzes.items()]
+
+    def rows():
+        pages = _iter_pages(
+            lambda: (supabase.table("class_students")
+                     .select("student_id, full_name, seat_no, email, enrolled_at")
+                     .eq("class_id", class_id)),
+            "enrolled_at", "student_id",
+        )
+        for studs in pages:
+            latest: Dict[Tuple[str, int], Any] = {}
+            seat_cond = _seat_match_cond(s.get("seat_no") for s in studs)
+            if layout == "per_quiz" and quizzes and seat_cond:
+                rs = (supabase.table("results")
+                      .select("quiz_id, seat_no, score, submitted_at")
+                      .eq("class_id", class_id)
+                      .or_(seat_cond)
+                      .in_("quiz_id", list(quizzes))
+                      .order("submitted_at")
+                      .execute().data or [])
+                for r in rs:  # ascending, so the latest submission wins
+                    latest[((r.get("seat_no") or "").upper(), r["quiz_id"])] = r.get("score")
+
+            for s in studs:
+                rec = _record_row(s, state)
+                row = {
+                    "seat": rec["seat"], "name": rec["name"], "email": rec["email"],
+                    "total_obtained": rec["total_obtained"], "total_possible": rec["total_possible"],
+                    "average": rec["average"],
+                }
+                if layout == "summary":
+                    last = rec["last"] or {}
+                    row.update({"last_quiz": last.get("quiz"), "last_score": last.get("score"),
+                                "last_total": last.get("total"), "last_date": last.get("date")})
+                else:
+                    for qid, col in quiz_cols.items():
+                        score = latest.get((rec["seat"], qid))
+                        row[col] = int(round(score)) if isinstance(score, (int, float)) else None
+                yield row
+
+    return _export_response(fmt, f"class-{class_id}-records", columns, rows())
+
+@app.get("/quizzes/{quiz_id}/results/export")
+def export_quiz_results(quiz_id: int, format: str = "csv"):
+    """Every submission for one quiz, newest first, with the quiz total from _build_quiz_totals."""
+    fmt = _check_export_format(format)
+    quiz = (supabase.table("quizzes").select("quiz_id, class_id, title")
+            .eq("quiz_id", quiz_id).limit(1).execute().data)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    class_id = quiz[0].get("class_id")
+    total = int(_build_quiz_totals([quiz_id]).get(quiz_id, 0))
+    header = ["seat", "name", "email", "score", "total", "percent", "submitted_at"]
+
+    def rows():
+        pages = _iter_pages(
+            lambda: (supabase.table("results")
+                     .select("seat_no, email, score, submitted_at")
+                     .eq("quiz_id", quiz_id)),
+            "submitted_at", "seat_no",
+        )
+        for page in pages:
+            names: Dict[str, str] = {}
+            seat_cond = _seat_match_cond(r.get("seat_no") for r in page)
+            if class_id is not None and seat_cond:
+                enr = (supabase.table("class_students")
+                       .select("seat_no, full_name")
+                       .eq("class_id", class_id)
+                       .or_(seat_cond)
+                       .execute().data or [])
+                names = {(e.get("seat_no") or "").upper(): e.get("full_name") for e in enr}
+            for r in page:
+                seat = (r.get("seat_no") or "").upper()
+                score = r.get("score")
+                yield {
+                    "seat": seat,
+                    "name": names.get(seat),
+                    "email": r.get("email"),
+                    "score": int(round(score)) if isinstance(score, (int, float)) else None,
+                    "total": total,
+                    "percent": _pct(score / total * 100) if total and isinstance(score, (int, float)) else None,
+                    "submitted_at": r.get("submitted_at"),
+                }
+
+    return _export_response(fmt, f"quiz-{quiz_id}-results", [(h, h) for h in header], rows())
+
+# =========================
+# Cache stats (declared before the generic /{table}/{id} routes)
+# =========================
+@app.get("/cache/stats")
+def cache_stats():
+    return {name: c.stats() for name, c in CACHES.items()}
+
 # =========================
 # Generic CRUD (unchanged)
 # =========================
+def _invalidate_caches_for(table: str, quiz_id=None):
+    # Rows addressed by question/option id don't say which quiz they belong
+    # to; writes there are rare enough that dropping every payload is fine.
+    if table in ("quizzes", "questions", "question_options", "results"):
+        _records_invalidate()
+    if table in ("quizzes", "questions") and quiz_id is not None:
+        try:
+            _invalidate_quiz_full(int(quiz_id))
+            _forget_quiz_totals(int(quiz_id))
+            return
+        except (TypeError, ValueError):
+            pass
+    if table in ("quizzes", "questions", "question_options"):
+        _invalidate_quiz_full()
+    if table in ("quizzes", "questions"):
+        _forget_quiz_totals()
+
 @app.post("/{table}/", status_code=201)
 def create_record(table: str, record: GenericRecord):
     try:
@@ -1332,16 +3075,40 @@ def create_record(table: str, record: GenericRecord):
             raise HTTPException(status_code=404, detail="Table not allowed")
         payload = record.data.copy()
         r = supabase.table(table).insert(payload).execute()
+        _invalidate_caches_for(table, payload.get("quiz_id"))
+        if table == "questions":
+            _questions_changed(r.data)
         return {"inserted": r.data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/{table}/")
-def list_records(table: str, limit: int = 100, offset: int = 0):
+def list_records(table: str, limit: int = 100, offset: int = 0, cursor: Optional[str] = None):
+    """
+    Tables with a single-column key are ordered by it and return "next" for
+    keyset paging (offset still works but is ignored once a cursor is given);
+    the rest keep plain limit/offset and "next" is always null. limit is
+    clamped to PAGE_MAX rather than rejected; follow "next" for the rest.
+    """
     if table not in ALLOWED_TABLES:
         raise HTTPException(status_code=404, detail="Table not allowed")
-    r = supabase.table(table).select("*").limit(limit).offset(offset).execute()
-    return {"rows": r.data}
+    limit = min(limit, PAGE_MAX)
+    if limit < 1:
+        return {"rows": [], "next": None}
+    pk = TABLE_PK.get(table)
+    if pk is None:
+        if cursor:
+            raise HTTPException(status_code=400, detail=f"'{table}' has no single-column key to page on")
+        r = supabase.table(table).select("*").limit(limit).offset(offset).execute()
+        return {"rows": r.data, "next": None}
+
+    q = supabase.table(table).select("*").order(pk)
+    if cursor:
+        q = q.gt(pk, _decode_cursor(table, cursor, 1)[0])
+    elif offset:
+        q = q.offset(offset)
+    rows, nxt = _page(q.limit(limit + 1).execute().data or [], limit, table, lambda r: [r[pk]])
+    return {"rows": rows, "next": nxt}
 
 @app.get("/{table}/{id}")
 def get_record(table: str, id: str):
@@ -1360,6 +3127,9 @@ def update_record(table: str, id: str, record: GenericRecord):
     payload = record.data.copy()
     payload["updated_at"] = now_iso()
     r = supabase.table(table).update(payload).eq("user_id" if table=="profiles" else "id", id).execute()
+    _invalidate_caches_for(table, id if table == "quizzes" else None)
+    if table == "questions":
+        _questions_changed(r.data)
     return {"updated": r.data}
 
 @app.delete("/{table}/{id}", status_code=204)
@@ -1370,29 +3140,53 @@ def delete_record(table: str, id: str):
     if table in ("class_students", "results"):
         raise HTTPException(status_code=400, detail=f"Use the specific delete endpoint for '{table}' (composite key)")
 
-    id_column = {
-        "profiles": "user_id",
-        "classes": "class_id",
-        "quizzes": "quiz_id",
-        "questions": "question_id",
-        "question_options": "option_id"
-    }.get(table, "id")
+    id_column = TABLE_PK.get(table, "id")
 
     try:
-        supabase.table(table).delete().eq(id_column, id).execute()
+        r = supabase.table(table).delete().eq(id_column, id).execute()
+        _invalidate_caches_for(table, id if table == "quizzes" else None)
+        if table == "questions":
+            _questions_changed(r.data)
         return JSONResponse(status_code=204, content={})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/classes_with_counts")
-def classes_with_counts():
-    cr = (supabase.table("classes")
-          .select("class_id, course_name, course_code, department, semester, section, created_at")
-          .order("created_at", desc=True).execute())
-    classes = cr.data or []
-
-    sr = supabase.table("class_students").select("class_id").execute()
-    cnt = Counter([row["class_id"] for row in (sr.data or [])])
+def classes_with_counts(
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    """Same paging contract as GET /quizzes; q matches a course name or code prefix."""
+    paged = limit is not None or cursor is not None
+    limit = limit or (PAGE_DEFAULT if paged else None)
+    after = _decode_cursor("classes", cursor, 2) if cursor else None
+
+    def build(cols):
+        qb = supabase.table("classes").select(cols).order("created_at", desc=True).order("class_id", desc=True)
+        if created_from:
+            qb = qb.gte("created_at", created_from)
+        if created_to:
+            qb = qb.lte("created_at", created_to)
+        qb = _apply_conds(qb, [
+            _keyset_cond("created_at", "class_id", after) if after else None,
+            _prefix_cond(["course_name", "course_code"], q),
+        ])
+        return qb.limit(limit + 1) if limit else qb
+
+    classes, counts = _select_with_counts(
+        build,
+        ["class_students"],
+        cols="class_id, course_name, course_code, department, semester, section, created_at",
+    )
+    if counts is not None:
+        cnt = {c["class_id"]: counts["class_students"][i] for i, c in enumerate(classes)}
+    classes, nxt = _page(classes, limit, "classes", lambda c: [c.get("created_at"), c["class_id"]])
+    if counts is None:
+        by_id = _counts_by("class_students", "class_id", [c["class_id"] for c in classes])
+        cnt = {c["class_id"]: by_id.get(c["class_id"], 0) for c in classes}
 
     out = [
         {
@@ -1406,7 +3200,7 @@ def classes_with_counts():
         }
         for c in classes
     ]
-    return {"rows": out}
+    return {"rows": out, "next": nxt} if paged else {"rows": out}
 
 @app.get("/ping")
 def ping():
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# main.py refuses to import without these; nothing here talks to Supabase
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
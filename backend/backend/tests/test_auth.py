@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+import main
+
+SECRET = "test-secret-test-secret-test-secret"
+
+
+def _token(secret=SECRET, **claims):
+    body = {"sub": "u1", "aud": "authenticated", "exp": time.time() + 60, **claims}
+    return jwt.encode(body, secret, algorithm="HS256")
+
+
+@pytest.fixture(autouse=True)
+def _secret(monkeypatch):
+    monkeypatch.setattr(main, "SUPABASE_JWT_SECRET", SECRET)
+
+
+def test_valid_token_is_accepted_locally():
+    user, exp = asyncio.run(main._verify_token_locally(_token()))
+    assert user.user_id == "u1" and exp
+
+
+@pytest.mark.parametrize("token", [
+    _token(secret="another-secret-another-secret-xx"),
+    _token(aud="someone-else"),
+    jwt.encode({"aud": "authenticated", "exp": time.time() + 60}, SECRET, algorithm="HS256"),
+    "not-a-jwt",
+])
+def test_invalid_token_is_rejected_without_remote(token):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(main._verify_token_locally(token))
+    assert e.value.status_code == 401
+
+
+def test_no_key_falls_back(monkeypatch):
+    monkeypatch.setattr(main, "SUPABASE_JWT_SECRET", None)
+    assert asyncio.run(main._verify_token_locally(_token())) is None
@@ -0,0 +1,14 @@
+import main
+
+
+def test_seat_match_is_case_insensitive_and_literal():
+    cond = main._seat_match_cond(["Bcs-21F-012", "a_b", None, " "])
+    assert cond == 'seat_no.ilike."Bcs-21F-012",seat_no.ilike."a\\\\_b"'
+
+
+def test_seat_match_without_seats_is_none():
+    assert main._seat_match_cond([None, ""]) is None
+
+
+def test_prefix_filter_escapes_underscore():
+    assert main._prefix_cond(["title"], "a_b") == 'or(title.ilike."a\\\\_b*")'
@@ -0,0 +1,59 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+import main
+
+
+def _stub_generate(calls):
+    """Honours the prompt's contract: mixed sets are MCQs first, then shorts."""
+    async def fake(topic=None, pdf_text=None, n_questions=5, format_type="mcq", retries=2):
+        calls.append(n_questions)
+        if format_type == "mixed":
+            mcq, short = main._mixed_split(n_questions)
+            types = ["mcq"] * mcq + ["short"] * short
+        else:
+            types = [format_type] * n_questions
+        return [{"type": t, "text": f"{pdf_text[:4]}-{k}", "correct_answer": "x"} for k, t in enumerate(types)]
+    return fake
+
+
+@pytest.mark.parametrize("n_chunks", [1, 3, 10, 20])
+def test_plan_mixed_quota_matches_whole_quiz_split(n_chunks):
+    plan = main._plan_chunk_counts(["x" * 800] * n_chunks, 10, "mixed")
+    assert sum(q["mcq"] for q, _ in plan) == 7
+    assert sum(q["short"] for q, _ in plan) == 3
+    for quota, ask in plan:
+        assert ask >= sum(quota.values())
+
+
+def test_plan_single_format_keeps_total():
+    plan = main._plan_chunk_counts(["a" * 100, "b" * 300], 8, "mcq")
+    assert [q["all"] for q, _ in plan] == [2, 6]
+
+
+@pytest.mark.parametrize("n_chunks", [1, 3, 10, 20])
+def test_generate_mixed_keeps_mcq_short_split(monkeypatch, n_chunks):
+    calls = []
+    monkeypatch.setattr(main, "call_ai_generate", _stub_generate(calls))
+    chunks = [f"{i:04d}" + "x" * 796 for i in range(n_chunks)]
+    out = asyncio.run(main.generate_from_chunks(chunks, 10, "mixed"))
+    assert len(out) == 10
+    assert Counter(q["type"] for q in out) == Counter({"mcq": 7, "short": 3})
+
+
+def test_generate_fills_from_other_type_when_one_runs_dry(monkeypatch):
+    async def only_mcq(topic=None, pdf_text=None, n_questions=5, format_type="mcq", retries=2):
+        return [{"type": "mcq", "text": f"q{k}", "correct_answer": "x"} for k in range(n_questions)]
+    monkeypatch.setattr(main, "call_ai_generate", only_mcq)
+    out = asyncio.run(main.generate_from_chunks(["x" * 800] * 3, 10, "mixed"))
+    assert len(out) == 10
+
+
+@pytest.mark.parametrize("n", [1, 3, 5, 10])
+def test_plan_never_asks_a_short_tail(n):
+    chunks = ["x" * 800] * 12 + ["abc"]
+    counts = main._split_by_length(chunks, n)
+    assert sum(counts) == n
+    assert counts[-1] == 0
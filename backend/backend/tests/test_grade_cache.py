@@ -0,0 +1,39 @@
+import asyncio
+import sqlite3
+
+import main
+
+
+class _LockedDb:
+    def execute(self, *a, **k):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def _locked(monkeypatch):
+    monkeypatch.setattr(main, "GRADE_CACHE_DB", "grades.sqlite")
+    monkeypatch.setattr(main, "_grade_db", lambda: _LockedDb())
+    main._grade_cache.clear()
+
+
+def test_locked_db_is_a_miss(monkeypatch):
+    _locked(monkeypatch)
+    assert asyncio.run(main._grade_cached("k")) is None
+
+
+def test_locked_db_write_keeps_memory_tier(monkeypatch):
+    _locked(monkeypatch)
+    asyncio.run(main._grade_remember("k", 3))
+    assert main._grade_cache.get("k") == 3
+
+
+def test_batch_scores_survive_a_failed_cache_write(monkeypatch):
+    async def batch(chunk, max_marks=3):
+        return {"1": 3}
+
+    async def broken_remember(key, score):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(main, "call_ai_evaluate_batch", batch)
+    monkeypatch.setattr(main, "_grade_remember", broken_remember)
+    chunk = [{"question_id": 1, "question": "q", "answer": "a"}]
+    assert asyncio.run(main._grade_batch_chunk(chunk, 3)) == {"1": 3}
@@ -0,0 +1,32 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class _Query:
+    def execute(self):
+        return "ran"
+
+
+def test_pools_survive_a_second_lifespan():
+    for _ in range(2):
+        with TestClient(main.app):
+            assert asyncio.run(main.adb(_Query())) == "ran"
+            assert main._pool("ocr").submit(lambda: 1).result() == 1
+
+
+def test_grading_limit_survives_a_second_loop(monkeypatch):
+    async def slow_eval(question, answer, max_marks=3):
+        await asyncio.sleep(0.01)
+        return {"score": 1}
+
+    monkeypatch.setattr(main, "call_ai_evaluate", slow_eval)
+
+    async def burst():
+        n = main.AI_GRADING_CONCURRENCY * 2 + 1
+        return await asyncio.gather(*(main._grade_short_answer("q", str(i), 3) for i in range(n)))
+
+    for _ in range(2):
+        assert all(r == (1, None) for r in asyncio.run(burst()))
@@ -0,0 +1,58 @@
+import pytest
+
+import main
+
+
+class _Page:
+    def __init__(self, text):
+        self.text = text
+
+    def extract_text(self):
+        return self.text
+
+
+class _Pdf:
+    def __init__(self, texts):
+        self.pages = [_Page(t) for t in texts]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _stub_pdf(monkeypatch, texts, ocr):
+    monkeypatch.setattr(main.pdfplumber, "open", lambda _: _Pdf(texts))
+    monkeypatch.setattr(main, "_ocr_pdf_page", ocr)
+
+
+def _no_poppler(path, page_no):
+    raise RuntimeError("Unable to get page count. Is poppler installed and in PATH?")
+
+
+def test_failed_ocr_page_keeps_text_of_other_pages(monkeypatch):
+    body = "Photosynthesis converts light energy into chemical energy."
+    _stub_pdf(monkeypatch, [body, "Cover", body], _no_poppler)
+    out = main._extract_pdf_text(b"%PDF")
+    assert out == f"{body}\nCover\n{body}\n"
+
+
+def test_ocr_result_replaces_thin_text_layer(monkeypatch):
+    _stub_pdf(monkeypatch, ["x" * 40, ""], lambda path, page_no: f"ocr page {page_no}")
+    assert main._extract_pdf_text(b"%PDF") == "x" * 40 + "\nocr page 2\n"
+
+
+def test_raises_when_no_page_yields_text(monkeypatch):
+    _stub_pdf(monkeypatch, ["", ""], _no_poppler)
+    with pytest.raises(RuntimeError, match="poppler"):
+        main._extract_pdf_text(b"%PDF")
+
+
+def test_corrupt_disk_cache_is_a_miss(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "EXTRACT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "_ocr_image_bytes", lambda raw: "fresh text")
+    main._extract_cache.clear()
+    key = main._extract_cache_key("image", b"img")
+    (tmp_path / f"{key}.txt").write_bytes(b"\xff\xfe\xfa")
+    assert main._extract_upload_text("image", b"img") == "fresh text"
@@ -0,0 +1,34 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("answer, correct, expected", [
+    # blank / nothing to compare against
+    ("", "photosynthesis", 0),
+    ("   ", "photosynthesis", 0),
+    (None, "photosynthesis", 0),
+    ("chlorophyll", None, None),
+    # exact after normalisation
+    ("Photosynthesis.", "photosynthesis", 3),
+    ("  The  Mitochondria ", "the mitochondria", 3),
+    # numbers, signs and fractions
+    ("1,000", "1000", 3),
+    ("3.50", "3.5", 3),
+    ("-5", "-5", 3),
+    ("-5", "5", None),
+    ("5", "-5", None),
+    ("-0.5", "-.5", 3),
+    ("1/2", "0.5", 3),
+    ("1/2", "-1/2", None),
+    ("1/0", "0", None),
+    ("6", "7", None),
+    # token sequences: order matters, stopwords don't
+    ("sun revolves around earth", "the earth revolves around the sun", None),
+    ("the earth revolves around the sun", "earth revolves around sun", 3),
+    ("not a mammal", "a mammal", None),
+    ("light energy", "chemical energy", None),
+    ("well-known fact", "well known fact", 3),
+])
+def test_pregrade_short(answer, correct, expected):
+    assert main._pregrade_short(answer, correct, 3) == expected
@@ -0,0 +1,107 @@
+import main
+
+
+def _state():
+    return {"quizzes": {7: {"title": "Q", "total": 4}}, "seats": {}}
+
+
+def test_string_score_counts_like_a_number():
+    state = _state()
+    main._records_add(state, "b1", 7, "3", "2024-01-01")
+    assert state["seats"]["B1"] == {
+        "obtained": 3, "possible": 4, "last": {"quiz_id": 7, "score": 3, "date": "2024-01-01"},
+    }
+
+
+def test_unparseable_score_is_not_counted():
+    state = _state()
+    main._records_add(state, "B1", 7, "n/a", "2024-01-01")
+    assert state["seats"]["B1"]["possible"] == 0
+    assert state["seats"]["B1"]["last"]["score"] == 0
+
+
+def test_note_result_never_raises_and_drops_the_class(monkeypatch):
+    main._records_cache.set(99, _state())
+
+    def boom(*a, **k):
+        raise RuntimeError("bad row")
+    monkeypatch.setattr(main, "_records_add", boom)
+    main._records_note_result(99, "B1", 7, 1, "2024-01-01")
+    assert main._records_cache.get(99) is None
+
+
+def test_quiz_totals_expire(monkeypatch):
+    loads = []
+
+    def load(qids):
+        loads.append(list(qids))
+        return {q: {"total": 5, "breakdown": {}} for q in qids}
+    monkeypatch.setattr(main, "_load_quiz_totals", load)
+    main._forget_quiz_totals()
+    main._remember_quiz_totals(41, {"total": 2, "breakdown": {}})
+    main._quiz_totals.set(42, {"total": 2, "breakdown": {}}, ttl=-1)
+    assert main._build_quiz_totals([41, 42]) == {41: 2, 42: 5}
+    assert loads == [[42]]
+
+
+class _Rows:
+    """Just enough of a supabase query chain to hand back fixed rows."""
+    def __init__(self, rows):
+        self.data = rows
+
+    def __getattr__(self, name):
+        return lambda *a, **k: self
+
+    def execute(self):
+        return self
+
+
+class _Db:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def table(self, name):
+        return _Rows(self.tables.get(name, []))
+
+
+def test_rebuild_repairs_stale_totals(monkeypatch):
+    monkeypatch.setattr(main, "supabase", _Db({
+        "quizzes": [{"quiz_id": 7, "title": "Q"}],
+        "questions": [{"quiz_id": 7, "question_type": "short_answer"}] * 2,
+        "results": [{"quiz_id": 7, "score": 5, "seat_no": "B1", "submitted_at": "2024-01-01"}],
+    }))
+    main._remember_quiz_totals(7, {"total": 2, "breakdown": {}})
+    main.rebuild_class_records(98)
+    state = main._records_cache.get(98)
+    assert state["quizzes"][7]["total"] == 6
+    assert state["seats"]["B1"]["possible"] == 6
+
+
+def test_records_read_mid_create_is_not_cached(monkeypatch):
+    seen = {}
+
+    class _Insert(_Rows):
+        def __init__(self, name, rows):
+            super().__init__(rows)
+            self.name, self.inserting = name, False
+
+        def insert(self, rows):
+            self.inserting = True
+            return self
+
+        def execute(self):
+            if self.name == "questions" and self.inserting:  # a records read lands between the inserts
+                seen["mid"] = main._records_state(97)["quizzes"]
+            return self
+
+    class _CreateDb:
+        def table(self, name):
+            rows = {"quizzes": [{"quiz_id": 500, "title": "New"}],
+                    "questions": [{"question_id": 1, "quiz_id": 500}]}.get(name, [])
+            return _Insert(name, rows)
+
+    monkeypatch.setattr(main, "supabase", _CreateDb())
+    main._create_quiz_with_questions({"class_id": 97, "title": "New"},
+                                     [({"question_type": "short_answer"}, [])])
+    assert 500 in seen["mid"]
+    assert main._records_cache.get(97) is None
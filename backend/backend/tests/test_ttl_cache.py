@@ -0,0 +1,13 @@
+import time
+
+import main
+
+
+def test_pop_ignores_expired_entries():
+    cache = main.TTLCache("test_pop_expiry", 10, 60)
+    cache.set("live", 1)
+    cache.set("stale", 2, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.pop("stale") is None
+    assert cache.pop("live") == 1
+    assert cache.pop("live") is None
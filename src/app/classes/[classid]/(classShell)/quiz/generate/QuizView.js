@@ -398,6 +398,7 @@ export default function QuizView() {
       if (pdfFile) fd.append("pdf", pdfFile, pdfFile.name);
       if (imageFile) fd.append("image", imageFile, imageFile.name);
       fd.append("preview", "1"); // preview mode
+      if (quiz) fd.append("fresh", "1"); // regenerating: skip the server's generation cache
 
       const res = await fetch(
         `${API}/generate_quiz?class_id=${encodeURIComponent(classId)}`,
@@ -62,16 +62,33 @@ export default function RecordView() {
     let alive = true;
     (async () => {
       setPageLoading(true);
+      let firstLoaded = false;
       try {
-        const r = await fetch(`${API}/classes/${classId}/records`);
+        // first page carries the class summary; the rest are appended as they arrive
+        const r = await fetch(`${API}/classes/${classId}/records?limit=100`);
         const j = await r.json();
         if (!alive) return;
         setStudents(j.students || []);
         setQuizzesConducted(j.quizzesConducted || 0);
         setAvgClassScore(j.avgClassScore ?? null);
         setTopPerformer(j.topPerformer ?? null);
-      } catch {
-        if (alive) {
+        setPageLoading(false);
+        firstLoaded = true;
+
+        let next = j.next;
+        while (next && alive) {
+          const rn = await fetch(`${API}/classes/${classId}/records?limit=100&cursor=${encodeURIComponent(next)}`);
+          if (!rn.ok) throw new Error(`HTTP ${rn.status}`);
+          const jn = await rn.json();
+          if (!alive) return;
+          setStudents((prev) => prev.concat(jn.students || []));
+          next = jn.next;
+        }
+      } catch (err) {
+        if (firstLoaded) {
+          // a later page failed: keep the rows already shown
+          console.error("Failed to load more records:", err);
+        } else if (alive) {
           setStudents([]);
           setQuizzesConducted(0);
           setAvgClassScore(null);